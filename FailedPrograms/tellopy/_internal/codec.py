@@ -0,0 +1,75 @@
+import struct
+
+from . import crc
+
+START_OF_PACKET = 0xcc
+
+# Precompiled layouts of the packets, all little endian
+HEADER = struct.Struct('<BHBBHH')      # start of packet, size << 3, crc8, packet type, command, sequence number
+SIZE = struct.Struct('<H')
+SEQUENCE = struct.Struct('<H')
+CRC16 = struct.Struct('<H')
+INT16 = struct.Struct('<H')
+TIME = struct.Struct('<5H')            # hour, minute, second, millisecond low and high byte
+STICK = struct.Struct('<IH5H')         # 4 x 11 bits axes packed in 48 bits, then TIME
+FLIGHT_DATA = struct.Struct('<5h3B2h7B')
+FILE_SIZE = struct.Struct('<xLH')      # size, filenum
+FILE_DATA = struct.Struct('<HLLH')     # filenum, chunk, fragment, size
+FILE_ACK = struct.Struct('<BHL')       # done, filenum, chunk
+FILE_COMPLETE = struct.Struct('<HL')   # filenum, size
+
+# Header bytes and their crc16 by (size, packet type, command, sequence number)
+headers = {}
+# crc8 of the first 3 bytes of the header by packet size
+header_crc8 = {}
+
+
+def get_header_crc8(size):
+    value = header_crc8.get(size)
+    if value is None:
+        value = header_crc8[size] = crc.crc8(bytearray((START_OF_PACKET,)) + SIZE.pack(size << 3))
+    return value
+
+
+def encode(cmd, pkt_type=0x68, payload=b'', seq_num=0):
+    """
+    Build a complete packet, crc included. The header and its crc are computed once
+    per kind of packet, so only the payload goes through the crc16.
+    """
+    size = HEADER.size + len(payload) + CRC16.size
+    key = (size, pkt_type, cmd, seq_num)
+    header = headers.get(key)
+    if header is None:
+        buf = HEADER.pack(START_OF_PACKET, size << 3, get_header_crc8(size), pkt_type, cmd, seq_num)
+        header = headers[key] = (buf, crc.crc16(buf))
+
+    buf = bytearray(header[0])
+    buf += payload
+    buf += CRC16.pack(crc.crc16(payload, header[1]))
+    return buf
+
+
+def fixup(buf, seq_num=0):
+    """
+    Complete the header of the packet in buf (size, crc8 and sequence number) and append its crc16.
+    """
+    size = len(buf) + CRC16.size
+    SIZE.pack_into(buf, 1, size << 3)
+    buf[3] = get_header_crc8(size)
+    SEQUENCE.pack_into(buf, 7, seq_num)
+    buf += CRC16.pack(crc.crc16(buf))
+
+
+def pack_time(time):
+    millisec = int(time.microsecond / 1000)
+    return TIME.pack(time.hour, time.minute, time.second, millisec & 0xff, (millisec >> 8) & 0xff)
+
+
+def pack_stick(axis1, axis2, axis3, axis4, time):
+    """
+    Payload of the stick command: the 4 axes of 11 bits, then the time.
+    """
+    axes = axis4 << 33 | axis3 << 22 | axis2 << 11 | axis1
+    millisec = int(time.microsecond / 1000)
+    return STICK.pack(axes & 0xffffffff, axes >> 32,
+                      time.hour, time.minute, time.second, millisec & 0xff, (millisec >> 8) & 0xff)
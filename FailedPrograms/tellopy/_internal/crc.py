@@ -1,3 +1,6 @@
+import sys
+from array import array
+
 crc8table = bytearray([
     0x00, 0x5e, 0xbc, 0xe2, 0x61, 0x3f, 0xdd, 0x83,
     0xc2, 0x9c, 0x7e, 0x20, 0xa3, 0xfd, 0x1f, 0x41,
@@ -33,10 +36,10 @@ crc8table = bytearray([
     0xb6, 0xe8, 0x0a, 0x54, 0xd7, 0x89, 0x6b, 0x35])
 
 
-def crc8(buf):
-    crc = 0x77
+def crc8(buf, crc=0x77):
+    table = crc8table
     for v in buf:
-        crc = crc8table[(crc ^ v) & 0xff]
+        crc = table[crc ^ v]
     return crc
 
 crc16table = [
@@ -74,8 +77,31 @@ crc16table = [
     0x7bc7, 0x6a4e, 0x58d5, 0x495c, 0x3de3, 0x2c6a, 0x1ef1, 0x0f78]
 
 
-def crc16(buf):
-    crc = 0x3692
-    for v in buf:
-        crc = crc16table[(crc ^ int(v)) & 0xff] ^ (crc >> 8)
+def make_crc16words():
+    # The crc after two bytes only depends on crc ^ (byte0 | byte1 << 8): one lookup per 16 bit word
+    table = array('H', bytes(2 * 0x10000))
+    for x in range(0x10000):
+        t = crc16table[x & 0xff]
+        table[x] = crc16table[(t ^ (x >> 8)) & 0xff] ^ (t >> 8)
+    return table
+
+crc16words = make_crc16words()
+
+
+def crc16(buf, crc=0x3692):
+    """
+    crc16 of a bytes-like object, read two bytes at a time through a memoryview.
+    Pass the crc of the previous bytes to continue a crc, e.g. after a cached header.
+    """
+    data = memoryview(buf)
+    end = len(data) & ~1
+    if sys.byteorder == 'little':
+        table = crc16words
+        for v in data[:end].cast('H'):
+            crc = table[crc ^ v]
+    else:
+        end = 0
+    table = crc16table
+    for v in data[end:]:
+        crc = table[(crc ^ v) & 0xff] ^ (crc >> 8)
     return crc
@@ -1,38 +1,161 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from . import event
+from . import logger
+
+log = logger.Logger('Dispatcher')
+
+POOL_SIZE = 4  # worker threads delivering the events of the background receivers
+SLOW_RECEIVER_TIME = 0.01  # in seconds, calls longer than that are logged
 
 
 class signal(object):
     All = event.Event('*')
 
 
+class Receiver(object):
+    """
+    A connected function and the timing of its calls. A background receiver is called
+    from the worker pool, in the order of the events, so it never holds up the thread
+    that sends them (e.g. the video thread). It keeps at most max_pending events,
+    dropping the oldest ones, or all of them if max_pending is None.
+    """
+    def __init__(self, function, background=False, max_pending=None):
+        self.function = function
+        self.name = getattr(function, '__qualname__', None) or str(function)
+        self.background = background
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.dropped = 0
+
+    def deliver(self, sig, named):
+        if not self.background:
+            self.call(sig, named)
+            return
+
+        with self.lock:
+            if self.max_pending is not None and self.max_pending <= len(self.pending):
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append((sig, named))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        get_pool().submit(self.drain)
+
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.scheduled = False
+                    return
+                sig, named = self.pending.popleft()
+            try:
+                self.call(sig, named)
+            except Exception as ex:
+                log.error('receiver %s: %s', self.name, ex)
+
+    def call(self, sig, named):
+        start = time.perf_counter()
+        try:
+            self.function(event=sig, **named)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.total_time += elapsed
+            if self.max_time < elapsed:
+                self.max_time = elapsed
+                if SLOW_RECEIVER_TIME < elapsed:
+                    log.warn('slow receiver %s: %.1f ms for %s', self.name, elapsed * 1000, sig)
+
+    def get_stats(self):
+        return {
+            'calls': self.calls,
+            'mean_time': self.total_time / self.calls if self.calls else None,
+            'max_time': self.max_time,
+            'pending': len(self.pending),
+            'dropped': self.dropped,
+        }
+
+
+# Receivers connected to each signal, and the receivers to call for each signal, All
+# included. Both are replaced on connect() and disconnect(), never modified, so send()
+# reads them without a lock.
 signals = {}
+dispatch = {}
+lock = threading.Lock()
+pool = None
+
+
+def get_pool():
+    global pool
+    if pool is None:
+        with lock:
+            if pool is None:
+                pool = ThreadPoolExecutor(POOL_SIZE, thread_name_prefix='dispatcher')
+    return pool
 
 
-def connect(receiver, sig=signal.All):
-    if sig in signals:
-        receivers = signals[sig]
-    else:
-        receivers = signals[sig] = []
-    receivers.append(receiver)
+def update_dispatch():
+    global dispatch
+    receivers_all = signals.get(signal.All, ())
+    table = dict((sig, receivers + receivers_all) for sig, receivers in signals.items() if sig is not signal.All)
+    table[signal.All] = receivers_all
+    dispatch = table
+
+
+def connect(receiver, sig=signal.All, background=False, max_pending=None):
+    """
+    Call receiver(event, sender, **args) on every sig event. With background=True, the
+    receiver is called from a worker thread instead of the thread that sends the event.
+    """
+    global signals
+    with lock:
+        table = dict(signals)
+        table[sig] = table.get(sig, ()) + (Receiver(receiver, background, max_pending),)
+        signals = table
+        update_dispatch()
 
 
 def disconnect(receiver, sig=signal.All):
-    if sig is signal.All:
-        for sig in signals:
-            if receiver in signals[sig]:
-                signals[sig].remove(receiver)
-    elif sig in signals:
-        if receiver in signals[sig]:
-            signals[sig].remove(receiver)
+    global signals
+    with lock:
+        table = {}
+        for s, receivers in signals.items():
+            if sig is signal.All or s is sig:
+                for i, r in enumerate(receivers):
+                    if r.function == receiver:
+                        receivers = receivers[:i] + receivers[i + 1:]
+                        break
+            table[s] = receivers
+        signals = table
+        update_dispatch()
 
 
 def send(sig, **named):
-    if sig in signals:
-        receivers = signals[sig] + signals[signal.All]
-    else:
-        receivers = signals[signal.All]
+    receivers = dispatch.get(sig)
+    if receivers is None:
+        receivers = dispatch.get(signal.All, ())
     for receiver in receivers:
-        receiver(event=sig, **named)
+        receiver.deliver(sig, named)
+
+
+def get_stats():
+    """
+    Returns:
+        dict: calls, mean and max time (s), pending and dropped events by receiver name and signal
+    """
+    return dict(('%s %s' % (r.name, sig), r.get_stats()) for sig, receivers in signals.items() for r in receivers)
 
 
 if __name__ == '__main__':
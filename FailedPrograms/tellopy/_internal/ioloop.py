@@ -0,0 +1,94 @@
+import heapq
+import selectors
+import time
+
+from . import logger
+from . utils import show_exception
+
+log = logger.Logger('IOLoop')
+
+
+class Timer(object):
+    """
+    Periodic timer of an IOLoop. Deadlines are absolute on the monotonic clock, so the
+    period doesn't drift with the time taken by the callbacks. Ticks missed while the
+    loop was busy are skipped, not run in a burst.
+    """
+    def __init__(self, interval, callback):
+        self.interval = interval
+        self.callback = callback
+        self.deadline = time.monotonic() + interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IOLoop(object):
+    """
+    Single thread multiplexing sockets and periodic timers with selectors: the readers
+    are called when their socket is readable, the timers when they are due. An exception
+    in a callback is logged and doesn't stop the loop.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []
+        self.count = 0  # tie breaker of the timers heap
+        self.idle_callbacks = []
+
+    def add_reader(self, sock, callback):
+        """Call callback() when sock is readable, it must not block."""
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, sock):
+        self.selector.unregister(sock)
+
+    def add_timer(self, interval, callback):
+        """Call callback() every interval seconds. Returns the Timer, to cancel it."""
+        timer = Timer(interval, callback)
+        self.__push(timer)
+        return timer
+
+    def add_idle_callback(self, callback):
+        """Call callback() once the sockets ready at the same time were all read."""
+        self.idle_callbacks.append(callback)
+
+    def __push(self, timer):
+        self.count += 1
+        heapq.heappush(self.timers, (timer.deadline, self.count, timer))
+
+    def run_once(self):
+        timeout = None
+        if self.timers:
+            timeout = max(self.timers[0][0] - time.monotonic(), 0)
+        for key, mask in self.selector.select(timeout):
+            self.__call(key.data)
+        for callback in self.idle_callbacks:
+            self.__call(callback)
+
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            deadline, count, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            self.__call(timer.callback)
+            timer.deadline = deadline + timer.interval
+            if timer.deadline <= now:
+                timer.deadline += timer.interval * int((now - timer.deadline) / timer.interval + 1)
+            self.__push(timer)
+
+    def __call(self, callback):
+        try:
+            callback()
+        except Exception as ex:
+            log.error('io loop: %s', ex)
+            show_exception(ex)
+
+    def run(self, running):
+        """Run until running() returns False."""
+        while running():
+            self.run_once()
+
+    def close(self):
+        self.selector.close()
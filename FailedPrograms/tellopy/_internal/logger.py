@@ -1,4 +1,8 @@
-import datetime
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
 import threading
 
 LOG_ERROR = 0
@@ -7,51 +11,155 @@ LOG_INFO = 2
 LOG_DEBUG = 3
 LOG_ALL = 99
 
+# tellopy levels to stdlib logging levels
+LEVELS = {
+    LOG_ERROR: logging.ERROR,
+    LOG_WARN: logging.WARNING,
+    LOG_INFO: logging.INFO,
+    LOG_DEBUG: logging.DEBUG,
+    LOG_ALL: 1,
+}
+
+LEVEL_NAMES = {
+    logging.ERROR: 'Error',
+    logging.WARNING: ' Warn',
+    logging.INFO: ' Info',
+    logging.DEBUG: 'Debug',
+}
+
+ROOT_LOGGER = 'tellopy'
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class Formatter(logging.Formatter):
+    """
+    Formats the records as the former print based logger did:
+    "Tello: 12:34:56.789:  Info: message"
+    """
+    def __init__(self):
+        logging.Formatter.__init__(self, '%(header)s: %(asctime)s.%(msecs)03d: %(level)s: %(message)s', '%H:%M:%S')
+
+    def format(self, record):
+        record.header = record.name[len(ROOT_LOGGER) + 1:]
+        record.level = LEVEL_NAMES.get(record.levelno, record.levelname)
+        return logging.Formatter.format(self, record)
+
+
+class DefaultHandler(logging.StreamHandler):
+    """
+    Writes the tellopy records to stdout, with the tellopy format, until the application
+    configures logging: once the root logger has handlers, the records propagate there
+    and this handler stays quiet.
+    """
+    def __init__(self):
+        logging.StreamHandler.__init__(self, sys.stdout)
+        self.setFormatter(Formatter())
+
+    def emit(self, record):
+        if not logging.getLogger().handlers:
+            logging.StreamHandler.emit(self, record)
+
+
+def _install_default_handler():
+    root = logging.getLogger(ROOT_LOGGER)
+    with _listener_lock:
+        if not root.handlers:
+            root.addHandler(DefaultHandler())
+
+
+def start_listener(*handlers):
+    """
+    Write the tellopy log records from a background thread, so the threads that log
+    (e.g. the I/O thread) never wait for stdout. The records go to handlers, by default
+    a stdout handler with the tellopy format, and no longer propagate to the root logger.
+    Call it from the application, once. stop_listener() restores the default handler.
+    """
+    global _listener
+    with _listener_lock:
+        _stop_listener()
+        if not handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(Formatter())
+            handlers = (handler,)
+
+        records = queue.Queue()
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            if isinstance(handler, (DefaultHandler, logging.handlers.QueueHandler)):
+                root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(records))
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_listener():
+    """
+    Flush the queued records and stop the background thread. The records are written
+    by the default handler and propagate to the root logger again.
+    """
+    with _listener_lock:
+        _stop_listener()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    if not root.handlers:
+        root.addHandler(DefaultHandler())
+    root.propagate = True
+
+
+atexit.register(stop_listener)
+
 
 class Logger:
+    """
+    Thin wrapper of a stdlib logger named 'tellopy.<header>'. Messages take their
+    arguments separately, as with the logging module, so they are only formatted if the
+    level is enabled: log.debug('recv: %s', HexString(data))
+    """
     def __init__(self, header=''):
-        self.log_level = LOG_INFO
         self.header_string = header
-        self.lock = threading.Lock()
-
-    def header(self):
-        now = datetime.datetime.now()
-        ts = ("%02d:%02d:%02d.%03d" % (now.hour, now.minute, now.second, now.microsecond/1000))
-        return "%s: %s" % (self.header_string, ts)
+        self.logger = logging.getLogger(ROOT_LOGGER + '.' + header)
+        _install_default_handler()
+        self.set_level(LOG_INFO)
 
     def set_level(self, level):
         self.log_level = level
+        self.logger.setLevel(LEVELS.get(level, 1))
 
-    def output(self, msg):
-        self.lock.acquire()
-        print(msg)
-        self.lock.release()
+    def is_enabled(self, level):
+        return self.logger.isEnabledFor(LEVELS.get(level, 1))
 
-    def error(self, str):
-        if self.log_level < LOG_ERROR:
-            return
-        self.output("%s: Error: %s" % (self.header(), str))
+    def error(self, msg, *args):
+        self.logger.error(msg, *args)
 
-    def warn(self, str):
-        if self.log_level < LOG_WARN:
-            return
-        self.output("%s:  Warn: %s" % (self.header(), str))
+    def warn(self, msg, *args):
+        self.logger.warning(msg, *args)
 
-    def info(self, str):
-        if self.log_level < LOG_INFO:
-            return
-        self.output("%s:  Info: %s" % (self.header(), str))
+    def info(self, msg, *args):
+        self.logger.info(msg, *args)
 
-    def debug(self, str):
-        if self.log_level < LOG_DEBUG:
-            return
-        self.output("%s: Debug: %s" % (self.header(), str))
+    def debug(self, msg, *args):
+        self.logger.debug(msg, *args)
 
 if __name__ == '__main__':
     log = Logger('test')
     log.error('This is an error message')
     log.warn('This is a warning message')
-    log.info('This is an info message')
+    log.info('This is an %s message', 'info')
     log.debug('This should ** NOT **  be displayed')
     log.set_level(LOG_ALL)
     log.debug('This is a debug message')
@@ -1,10 +1,9 @@
 import datetime
-from io import BytesIO
 
-from . import crc
+from . import codec
 from . utils import *
 
-START_OF_PACKET = 0xcc
+START_OF_PACKET = codec.START_OF_PACKET
 WIFI_MSG = 0x1a
 VIDEO_RATE_QUERY = 40
 LIGHT_MSG = 53
@@ -48,30 +47,17 @@ FlipForwardRight = 7
 class Packet(object):
     def __init__(self, cmd, pkt_type=0x68, payload=b''):
         if isinstance(cmd, str):
-            self.buf = bytearray()
-            for c in cmd:
-                self.buf.append(ord(c))
+            self.buf = bytearray(cmd, 'latin-1')
         elif isinstance(cmd, (bytearray, bytes)):
-            self.buf = bytearray()
-            self.buf[:] = cmd
+            self.buf = bytearray(cmd)
         else:
-            self.buf = bytearray([
-                START_OF_PACKET,
-                0, 0,
-                0,
-                pkt_type,
-                (cmd & 0xff), ((cmd >> 8) & 0xff),
-                0, 0])
+            self.buf = bytearray(codec.HEADER.pack(START_OF_PACKET, 0, 0, pkt_type, cmd, 0))
             self.buf.extend(payload)
 
     def fixup(self, seq_num=0):
         buf = self.get_buffer()
         if buf[0] == START_OF_PACKET:
-            buf[1], buf[2] = le16(len(buf)+2)
-            buf[1] = (buf[1] << 3)
-            buf[3] = crc.crc8(buf[0:3])
-            buf[7], buf[8] = le16(seq_num)
-            self.add_int16(crc.crc16(buf))
+            codec.fixup(buf, seq_num)
 
     def get_buffer(self):
         return self.buf
@@ -83,15 +69,12 @@ class Packet(object):
         self.buf.append(val & 0xff)
 
     def add_int16(self, val):
-        self.add_byte(val)
-        self.add_byte(val >> 8)
+        self.buf += codec.INT16.pack(val & 0xffff)
 
-    def add_time(self, time=datetime.datetime.now()):
-        self.add_int16(time.hour)
-        self.add_int16(time.minute)
-        self.add_int16(time.second)
-        self.add_int16(int(time.microsecond/1000) & 0xff)
-        self.add_int16((int(time.microsecond/1000) >> 8) & 0xff)
+    def add_time(self, time=None):
+        if time is None:
+            time = datetime.datetime.now()
+        self.buf += codec.pack_time(time)
 
     def get_time(self, buf=None):
         if buf is None:
@@ -105,86 +88,56 @@ class Packet(object):
 
 
 class FlightData(object):
+    __slots__ = (
+        'height', 'north_speed', 'east_speed', 'ground_speed', 'fly_time',
+        'imu_state', 'pressure_state', 'down_visual_state', 'power_state', 'battery_state',
+        'gravity_state', 'wind_state', 'imu_calibration_state', 'battery_percentage',
+        'drone_battery_left', 'drone_fly_time_left', 'em_sky', 'em_ground', 'em_open',
+        'drone_hover', 'outage_recording', 'battery_low', 'battery_lower', 'factory_mode',
+        'fly_mode', 'throw_fly_timer', 'camera_state', 'electrical_machinery_state',
+        'front_in', 'front_out', 'front_lsc', 'temperature_height',
+        'fly_speed', 'light_strength', 'smart_video_exit_mode', 'wifi_disturb', 'wifi_strength')
+
     def __init__(self, data):
-        self.battery_low = 0
-        self.battery_lower = 0
-        self.battery_percentage = 0
-        self.battery_state = 0
-        self.camera_state = 0
-        self.down_visual_state = 0
-        self.drone_battery_left = 0
-        self.drone_fly_time_left = 0
-        self.drone_hover = 0
-        self.em_open = 0
-        self.em_sky = 0
-        self.em_ground = 0
-        self.east_speed = 0
-        self.electrical_machinery_state = 0
-        self.factory_mode = 0
-        self.fly_mode = 0
         self.fly_speed = 0
-        self.fly_time = 0
-        self.front_in = 0
-        self.front_lsc = 0
-        self.front_out = 0
-        self.gravity_state = 0
-        self.ground_speed = 0
-        self.height = 0
-        self.imu_calibration_state = 0
-        self.imu_state = 0
         self.light_strength = 0
-        self.north_speed = 0
-        self.outage_recording = 0
-        self.power_state = 0
-        self.pressure_state = 0
         self.smart_video_exit_mode = 0
-        self.temperature_height = 0
-        self.throw_fly_timer = 0
         self.wifi_disturb = 0
         self.wifi_strength = 0
-        self.wind_state = 0
 
-        if len(data) < 24:
+        if len(data) < codec.FLIGHT_DATA.size:
+            for name in FlightData.__slots__[:-5]:
+                setattr(self, name, 0)
             return
 
-        self.height = int16(data[0], data[1])
-        self.north_speed = int16(data[2], data[3])
-        self.east_speed = int16(data[4], data[5])
-        self.ground_speed = int16(data[6], data[7])
-        self.fly_time = int16(data[8], data[9])
-
-        self.imu_state = ((data[10] >> 0) & 0x1)
-        self.pressure_state = ((data[10] >> 1) & 0x1)
-        self.down_visual_state = ((data[10] >> 2) & 0x1)
-        self.power_state = ((data[10] >> 3) & 0x1)
-        self.battery_state = ((data[10] >> 4) & 0x1)
-        self.gravity_state = ((data[10] >> 5) & 0x1)
-        self.wind_state = ((data[10] >> 7) & 0x1)
-
-        self.imu_calibration_state = data[11]
-        self.battery_percentage = data[12]
-        self.drone_battery_left = int16(data[13], data[14])
-        self.drone_fly_time_left = int16(data[15], data[16])
-
-        self.em_sky = ((data[17] >> 0) & 0x1)
-        self.em_ground = ((data[17] >> 1) & 0x1)
-        self.em_open = ((data[17] >> 2) & 0x1)
-        self.drone_hover = ((data[17] >> 3) & 0x1)
-        self.outage_recording = ((data[17] >> 4) & 0x1)
-        self.battery_low = ((data[17] >> 5) & 0x1)
-        self.battery_lower = ((data[17] >> 6) & 0x1)
-        self.factory_mode = ((data[17] >> 7) & 0x1)
-
-        self.fly_mode = data[18]
-        self.throw_fly_timer = data[19]
-        self.camera_state = data[20]
-        self.electrical_machinery_state = data[21]
-
-        self.front_in = ((data[22] >> 0) & 0x1)
-        self.front_out = ((data[22] >> 1) & 0x1)
-        self.front_lsc = ((data[22] >> 2) & 0x1)
-
-        self.temperature_height = ((data[23] >> 0) & 0x1)
+        (self.height, self.north_speed, self.east_speed, self.ground_speed, self.fly_time,
+         states, self.imu_calibration_state, self.battery_percentage,
+         self.drone_battery_left, self.drone_fly_time_left,
+         em_states, self.fly_mode, self.throw_fly_timer, self.camera_state,
+         self.electrical_machinery_state, front_states, temperature_states) = codec.FLIGHT_DATA.unpack_from(data)
+
+        self.imu_state = ((states >> 0) & 0x1)
+        self.pressure_state = ((states >> 1) & 0x1)
+        self.down_visual_state = ((states >> 2) & 0x1)
+        self.power_state = ((states >> 3) & 0x1)
+        self.battery_state = ((states >> 4) & 0x1)
+        self.gravity_state = ((states >> 5) & 0x1)
+        self.wind_state = ((states >> 7) & 0x1)
+
+        self.em_sky = ((em_states >> 0) & 0x1)
+        self.em_ground = ((em_states >> 1) & 0x1)
+        self.em_open = ((em_states >> 2) & 0x1)
+        self.drone_hover = ((em_states >> 3) & 0x1)
+        self.outage_recording = ((em_states >> 4) & 0x1)
+        self.battery_low = ((em_states >> 5) & 0x1)
+        self.battery_lower = ((em_states >> 6) & 0x1)
+        self.factory_mode = ((em_states >> 7) & 0x1)
+
+        self.front_in = ((front_states >> 0) & 0x1)
+        self.front_out = ((front_states >> 1) & 0x1)
+        self.front_lsc = ((front_states >> 2) & 0x1)
+
+        self.temperature_height = ((temperature_states >> 0) & 0x1)
 
     def __str__(self):
         return (
@@ -198,32 +151,57 @@ class FlightData(object):
             "")
 
 class DownloadedFile(object):
+    """
+    A file sent by the drone, e.g. a picture. The file comes in fragments of 1024 bytes,
+    grouped in chunks of 8 fragments. The fragments are written in place into a buffer
+    of the size of the file, and a bitmap with one bit per fragment (one byte per chunk)
+    tells which ones were received, so duplicates are ignored.
+    """
+    FRAGMENT_SIZE = 1024
+    FRAGMENTS_PER_CHUNK = 8
+
     def __init__(self, filenum, size):
         self.filenum = filenum
         self.size = size
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.fragments = (size + self.FRAGMENT_SIZE - 1) // self.FRAGMENT_SIZE
+        self.fragments_received = 0
         self.bytes_recieved = 0
-        self.chunks_received = [0x00] * int((size / 1024 + 1) / 8 + 1)
-        self.buffer = BytesIO()
+        self.chunks_received = bytearray((self.fragments + self.FRAGMENTS_PER_CHUNK - 1) // self.FRAGMENTS_PER_CHUNK)
+        self.duplicates = 0
 
     def done(self):
-        return self.bytes_recieved >= self.size
+        return self.fragments_received >= self.fragments
 
     def data(self):
-        return self.buffer.getvalue()
+        return self.buffer
+
+    def chunkMask(self, chunk):
+        # The last chunk may have less than 8 fragments
+        count = min(self.fragments - chunk * self.FRAGMENTS_PER_CHUNK, self.FRAGMENTS_PER_CHUNK)
+        return (1 << count) - 1
 
     def haveFragment(self, chunk, fragment):
         return self.chunks_received[chunk] & (1<<(fragment%8))
 
     def recvFragment(self, chunk, fragment, size, data):
+        """
+        Mark a fragment as received, data can be a memoryview of the packet.
+        Returns true if we have all fragments making up that chunk now.
+        """
+        offset = fragment * self.FRAGMENT_SIZE
+        if (chunk >= len(self.chunks_received) or fragment // self.FRAGMENTS_PER_CHUNK != chunk or
+                offset + size > self.size or size > len(data)):
+            return False
         if self.haveFragment(chunk, fragment):
+            self.duplicates += 1
             return False
-        # Mark a fragment as received.
-        # Returns true if we have all fragments making up that chunk now.
-        self.buffer.seek(fragment*1024)
-        self.buffer.write(data)
+        self.view[offset:offset + size] = data[:size]
+        self.fragments_received += 1
         self.bytes_recieved += size
         self.chunks_received[chunk] |= (1<<(fragment%8))
-        return self.chunks_received[chunk] == 0xFF
+        return self.chunks_received[chunk] == self.chunkMask(chunk)
 
 
 class VideoData(object):
@@ -251,3 +229,98 @@ class VideoData(object):
             loss = loss * VideoData.packets_per_frame + ((v0.h1 & 0x7f) - (v1.h1 & 0x7f) - 1)
 
         return loss
+
+
+class VideoFrameAssembler(object):
+    """
+    Group the video packets into whole H.264 frames (access units).
+
+    The first byte of a video packet is the frame number, the low 7 bits of the
+    second one the index of the packet in the frame, and its high bit marks the last
+    packet of the frame. A frame is complete once its packets arrived in order up to
+    the last one, or up to the first packet of the next frame. A frame with a missing
+    packet is dropped, and so are the following frames up to the next key frame (SPS
+    or IDR picture), since they refer to the lost data: the decoder only gets frames
+    it can decode.
+    """
+    def __init__(self):
+        self.frame_num = None  # frame being assembled
+        self.prev_frame_num = None  # last frame started
+        self.next_index = 0
+        self.parts = []
+        self.end_marks = False  # the stream marks the last packet of the frames
+        self.wait_key_frame = True
+
+        # Statistics
+        self.frames = 0
+        self.frames_dropped = 0
+        self.losses = 0
+
+    def add(self, data):
+        """
+        Add a video packet, header included.
+        Returns the frame completed by this packet, None otherwise.
+        """
+        frame_num = byte(data[0])
+        index = byte(data[1]) & 0x7f
+        last = byte(data[1]) & 0x80
+
+        frame = None
+        if index == 0:
+            if self.parts:
+                if not self.end_marks and frame_num == (self.frame_num + 1) & 0xff:
+                    frame = self.__complete()
+                else:
+                    self.__lost()
+            elif self.prev_frame_num is not None and frame_num != (self.prev_frame_num + 1) & 0xff:
+                # Whole frames are missing
+                self.__lost()
+            self.frame_num = frame_num
+            self.prev_frame_num = frame_num
+        elif frame_num != self.frame_num or index != self.next_index:
+            if frame_num != self.prev_frame_num:
+                # The first packets of this frame are missing
+                self.prev_frame_num = frame_num
+                self.__lost()
+            elif self.parts:
+                self.__lost()
+            return None
+
+        self.parts.append(bytes(data[2:]))
+        self.next_index = index + 1
+        if last:
+            self.end_marks = True
+            frame = self.__complete()
+        return frame
+
+    def __complete(self):
+        frame = b''.join(self.parts)
+        self.parts = []
+        self.frame_num = None
+        if self.wait_key_frame:
+            if not is_key_frame(frame):
+                self.frames_dropped += 1
+                return None
+            self.wait_key_frame = False
+        self.frames += 1
+        return frame
+
+    def __lost(self):
+        self.losses += 1
+        self.frames_dropped += 1
+        self.parts = []
+        self.frame_num = None
+        self.wait_key_frame = True
+
+
+def is_key_frame(frame):
+    """
+    True if the H.264 access unit holds an SPS or an IDR picture.
+    """
+    start = frame.find(b'\x00\x00\x01')
+    while 0 <= start and start + 3 < len(frame):
+        nal_type = byte(frame[start + 3]) & 0x1f
+        if nal_type == 5 or nal_type == 7:
+            return True
+        start = frame.find(b'\x00\x00\x01', start + 3)
+    return False
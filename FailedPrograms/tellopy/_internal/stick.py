@@ -0,0 +1,135 @@
+import socket
+import threading
+import time
+import datetime
+
+from . import codec
+from . import crc
+from . utils import *
+from . protocol import *
+
+
+class StickTransmitter(object):
+    """
+    Send the stick command of the drone at a fixed rate from a thread of its own, so
+    neither the received packets nor slow subscribers on the I/O thread can delay it.
+
+    The packet is built once: the header, its sequence number and its crc never
+    change, so each transmission only patches the axes and the time in place and
+    runs the crc16 over those 16 bytes. The intervals between two transmissions are
+    measured to report the jitter of the loop.
+    """
+    def __init__(self, drone, rate=50):
+        self.drone = drone
+        self.log = drone.log
+        self.buf = codec.encode(STICK_CMD, 0x60, bytes(codec.STICK.size))
+        self.view = memoryview(self.buf)
+        self.header_crc = crc.crc16(self.view[:codec.HEADER.size])
+        self.thread = None
+        self.stopped = threading.Event()
+        self.interval = 1.0 / rate
+        self.prev_time = None
+
+        # Statistics
+        self.sent = 0
+        self.errors = 0
+        self.intervals = 0
+        self.total_interval = 0.0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def set_rate(self, rate):
+        """Set the number of stick commands per second, effective after the next one."""
+        self.interval = 1.0 / rate
+        self.prev_time = None  # don't count the interval at the change in the jitter
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: rate, sent packets, send errors, mean interval, mean and max jitter (s)
+        """
+        return {
+            'rate': 1.0 / self.interval,
+            'sent': self.sent,
+            'errors': self.errors,
+            'mean_interval': self.total_interval / self.intervals if self.intervals else None,
+            'mean_jitter': self.total_jitter / self.intervals if self.intervals else None,
+            'max_jitter': self.max_jitter,
+        }
+
+    def pack(self, axis1, axis2, axis3, axis4, now):
+        """
+        Patch the axes and the time into the packet, then its crc16.
+
+        11 bits (-1024 ~ +1023) x 4 axis = 44 bits
+        44 bits will be packed in to 6 bytes (48 bits)
+
+                    axis4      axis3      axis2      axis1
+             |          |          |          |          |
+                 4         3         2         1         0
+        98765432109876543210987654321098765432109876543210
+         |       |       |       |       |       |       |
+             byte5   byte4   byte3   byte2   byte1   byte0
+        """
+        axes = axis4 << 33 | axis3 << 22 | axis2 << 11 | axis1
+        millisec = int(now.microsecond / 1000)
+        codec.STICK.pack_into(self.buf, codec.HEADER.size, axes & 0xffffffff, axes >> 32,
+                              now.hour, now.minute, now.second, millisec & 0xff, (millisec >> 8) & 0xff)
+        end = len(self.buf) - codec.CRC16.size
+        codec.CRC16.pack_into(self.buf, end, crc.crc16(self.view[codec.HEADER.size:end], self.header_crc))
+        return self.buf
+
+    def send(self):
+        drone = self.drone
+        axis1 = int(1024 + 660.0 * drone.right_x) & 0x7ff
+        axis2 = int(1024 + 660.0 * drone.right_y) & 0x7ff
+        axis3 = int(1024 + 660.0 * drone.left_y) & 0x7ff
+        axis4 = int(1024 + 660.0 * drone.left_x) & 0x7ff
+        buf = self.pack(axis1, axis2, axis3, axis4, datetime.datetime.now())
+        self.log.debug("stick command: yaw=%4d thr=%4d pit=%4d rol=%4d", axis4, axis3, axis2, axis1)
+        self.log.debug("stick command: %s", HexString(buf))
+        try:
+            drone.sock.sendto(buf, drone.tello_addr)
+        except socket.error as err:
+            self.errors += 1
+            self.log.error('stick command: %s', err)
+            return False
+        self.sent += 1
+        return True
+
+    def __tick(self):
+        if self.drone.state != self.drone.STATE_CONNECTED:
+            self.prev_time = None
+            return
+
+        now = time.monotonic()
+        if self.prev_time is not None:
+            interval = now - self.prev_time
+            jitter = abs(interval - self.interval)
+            self.intervals += 1
+            self.total_interval += interval
+            self.total_jitter += jitter
+            if self.max_jitter < jitter:
+                self.max_jitter = jitter
+        self.prev_time = now
+        self.send()
+
+    def __run(self):
+        # Deadlines are absolute on the monotonic clock, missed ones are skipped
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                deadline -= delay
+            elif self.stopped.wait(delay):
+                break
+            self.__tick()
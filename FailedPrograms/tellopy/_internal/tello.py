@@ -2,11 +2,10 @@ import threading
 import socket
 import time
 import datetime
-import struct
 import sys
 import os
 
-from . import crc
+from . import codec
 from . import logger
 from . import event
 from . import state
@@ -15,6 +14,8 @@ from . import video_stream
 from . utils import *
 from . protocol import *
 from . import dispatcher
+from . import ioloop
+from . import stick
 
 log = logger.Logger('Tello')
 
@@ -28,6 +29,7 @@ class Tello(object):
     EVENT_TIME = event.Event('time')
     EVENT_VIDEO_FRAME = event.Event('video frame')
     EVENT_VIDEO_DATA = event.Event('video data')
+    EVENT_VIDEO_ACCESS_UNIT = event.Event('video access unit')
     EVENT_DISCONNECTED = event.Event('disconnected')
     EVENT_FILE_RECEIVED = event.Event('file received')
     # internal events
@@ -56,6 +58,14 @@ class Tello(object):
     LOG_DEBUG = logger.LOG_DEBUG
     LOG_ALL = logger.LOG_ALL
 
+    KEY_FRAME_REQUEST_INTERVAL = 0.5  # in seconds, between two start video commands sent after a video loss
+    FILE_ACK_BATCH = 8  # chunk acks sent together, at the end of a burst of file data at the latest
+    STICK_RATE = 50  # stick commands per second, see set_stick_rate()
+    RECV_TIMEOUT = 2.0  # in seconds without packets from the drone before a timeout event
+    VIDEO_TIMEOUT = 5.0  # in seconds without video packets before a warning
+    VIDEO_KEEP_ALIVE_INTERVAL = 2.0  # in seconds, between two start video commands and video statistics
+    MAX_READ_TIME = 0.005  # in seconds reading a socket, at most one more packet, before the loop checks the timers
+
     def __init__(self, port=9000):
         self.tello_addr = ('192.168.10.1', 8889)
         self.debug = False
@@ -78,6 +88,8 @@ class Tello(object):
         self.exposure = 0
         self.video_encoder_rate = 4
         self.video_stream = None
+        self.video_assembler = VideoFrameAssembler()
+        self.key_frame_request_time = None
         self.wifi_strength = 0
 
         # video zoom state
@@ -85,15 +97,41 @@ class Tello(object):
 
         # File recieve state.
         self.file_recv = {}  # Map filenum -> protocol.DownloadedFile
+        self.file_acks = []  # payloads of the chunk acks not sent yet
 
         # Create a UDP socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind(('', self.port))
-        self.sock.settimeout(2.0)
+        self.recv_buffer = bytearray(self.udpsize)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.recv_time = time.monotonic()
+
+        # Video socket
+        self.video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.video_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 512 * 1024)
+        self.video_sock.bind(('', 6038))
+        log.info('video receive buffer size = %d', self.video_sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+        self.video_buffer = bytearray(self.udpsize)
+        self.video_view = memoryview(self.video_buffer)
+        self.video_recv_time = time.monotonic()
+        self.prev_video_data = None
+        self.prev_video_ts = None
+        self.video_history = []
+
+        # One thread receives the packets of both sockets and runs the timers
+        self.loop = ioloop.IOLoop()
+        self.loop.add_reader(self.sock, self.__recv_packets)
+        self.loop.add_reader(self.video_sock, self.__recv_video_packets)
+        self.loop.add_idle_callback(self.__send_file_acks)
+        self.loop.add_timer(self.RECV_TIMEOUT / 4, self.__check_recv_timeout)
+        self.loop.add_timer(self.VIDEO_KEEP_ALIVE_INTERVAL, self.__video_keep_alive)
+
+        # The stick commands have their own thread, so that slow subscribers can't hold them up
+        self.stick = stick.StickTransmitter(self, self.STICK_RATE)
 
         dispatcher.connect(self.__state_machine, dispatcher.signal.All)
-        threading.Thread(target=self.__recv_thread).start()
-        threading.Thread(target=self.__video_thread).start()
+        threading.Thread(target=self.__io_thread).start()
+        self.stick.start()
 
     def set_loglevel(self, level):
         """
@@ -137,12 +175,30 @@ class Tello(object):
         port0 = (int(port/1000) % 10) << 4 | (int(port/100) % 10)
         port1 = (int(port/10) % 10) << 4 | (int(port/1) % 10)
         buf = 'conn_req:%c%c' % (chr(port0), chr(port1))
-        log.info('send connection request (cmd="%s%02x%02x")' % (str(buf[:-2]), port0, port1))
+        log.info('send connection request (cmd="%s%02x%02x")', buf[:-2], port0, port1)
         return self.send_packet(Packet(buf))
 
-    def subscribe(self, signal, handler):
-        """Subscribe a event such as EVENT_CONNECTED, EVENT_FLIGHT_DATA, EVENT_VIDEO_FRAME and so on."""
-        dispatcher.connect(handler, signal)
+    def subscribe(self, signal, handler, background=False, max_pending=None):
+        """
+        Subscribe a event such as EVENT_CONNECTED, EVENT_FLIGHT_DATA, EVENT_VIDEO_FRAME and so on.
+        Slow handlers, e.g. displays, should pass background=True: they are then called from
+        a worker thread and don't hold up the reception of the packets. max_pending limits the
+        events waiting for such a handler, the oldest ones are dropped.
+        """
+        dispatcher.connect(handler, signal, background, max_pending)
+
+    def set_stick_rate(self, rate):
+        """Set the number of stick commands sent per second while connected."""
+        log.info('set_stick_rate(rate=%d)', rate)
+        self.stick.set_rate(rate)
+
+    def get_stick_stats(self):
+        """Get the rate, the number of stick commands sent, and the mean and max jitter of their intervals."""
+        return self.stick.get_stats()
+
+    def get_subscriber_stats(self):
+        """Get the number of calls, the mean and max time of each handler, and its pending and dropped events."""
+        return dispatcher.get_stats()
 
     def __publish(self, event, data=None, **args):
         args.update({'data': data})
@@ -150,7 +206,7 @@ class Tello(object):
             del args['signal']
         if 'sender' in args:
             del args['sender']
-        log.debug('publish signal=%s, args=%s' % (event, args))
+        log.debug('publish signal=%s, args=%s', event, args)
         dispatcher.send(event, sender=self, **args)
 
     def takeoff(self):
@@ -160,14 +216,14 @@ class Tello(object):
         pkt.add_byte(0x1e)  # 30m
         pkt.add_byte(0x00)
         self.send_packet(pkt)
-        log.info('takeoff (cmd=0x%02x seq=0x%04x)' % (TAKEOFF_CMD, self.pkt_seq_num))
+        log.info('takeoff (cmd=0x%02x seq=0x%04x)', TAKEOFF_CMD, self.pkt_seq_num)
         pkt = Packet(TAKEOFF_CMD)
         pkt.fixup()
         return self.send_packet(pkt)
 
     def land(self):
         """Land tells the drone to come in for landing."""
-        log.info('land (cmd=0x%02x seq=0x%04x)' % (LAND_CMD, self.pkt_seq_num))
+        log.info('land (cmd=0x%02x seq=0x%04x)', LAND_CMD, self.pkt_seq_num)
         pkt = Packet(LAND_CMD)
         pkt.add_byte(0x00)
         pkt.fixup()
@@ -175,7 +231,7 @@ class Tello(object):
 
     def palm_land(self):
         """Tells the drone to wait for a hand underneath it and then land."""
-        log.info('palmland (cmd=0x%02x seq=0x%04x)' % (PALM_LAND_CMD, self.pkt_seq_num))
+        log.info('palmland (cmd=0x%02x seq=0x%04x)', PALM_LAND_CMD, self.pkt_seq_num)
         pkt = Packet(PALM_LAND_CMD)
         pkt.add_byte(0x00)
         pkt.fixup()
@@ -187,7 +243,7 @@ class Tello(object):
         self.__publish(event=self.__EVENT_QUIT_REQ)
 
     def __send_time_command(self):
-        log.info('send_time (cmd=0x%02x seq=0x%04x)' % (TIME_CMD, self.pkt_seq_num))
+        log.info('send_time (cmd=0x%02x seq=0x%04x)', TIME_CMD, self.pkt_seq_num)
         pkt = Packet(TIME_CMD, 0x50)
         pkt.add_byte(0)
         pkt.add_time()
@@ -208,14 +264,13 @@ class Tello(object):
     def set_video_mode(self, zoom=False):
         """Tell the drone whether to capture 960x720 4:3 video, or 1280x720 16:9 zoomed video.
         4:3 has a wider field of view (both vertically and horizontally), 16:9 is crisper."""
-        log.info('set video mode zoom=%s (cmd=0x%02x seq=0x%04x)' % (
-            zoom, VIDEO_START_CMD, self.pkt_seq_num))
+        log.info('set video mode zoom=%s (cmd=0x%02x seq=0x%04x)', zoom, VIDEO_START_CMD, self.pkt_seq_num)
         self.zoom = zoom
         return self.__send_video_mode(int(zoom))
 
     def start_video(self):
         """Start_video tells the drone to send start info (SPS/PPS) for video stream."""
-        log.info('start video (cmd=0x%02x seq=0x%04x)' % (VIDEO_START_CMD, self.pkt_seq_num))
+        log.info('start video (cmd=0x%02x seq=0x%04x)', VIDEO_START_CMD, self.pkt_seq_num)
         self.video_enabled = True
         self.__send_exposure()
         self.__send_video_encoder_rate()
@@ -225,7 +280,7 @@ class Tello(object):
         """Set_exposure sets the drone camera exposure level. Valid levels are 0, 1, and 2."""
         if level < 0 or 2 < level:
             raise error.TelloError('Invalid exposure level')
-        log.info('set exposure (cmd=0x%02x seq=0x%04x)' % (EXPOSURE_CMD, self.pkt_seq_num))
+        log.info('set exposure (cmd=0x%02x seq=0x%04x)', EXPOSURE_CMD, self.pkt_seq_num)
         self.exposure = level
         return self.__send_exposure()
 
@@ -237,8 +292,7 @@ class Tello(object):
 
     def set_video_encoder_rate(self, rate):
         """Set_video_encoder_rate sets the drone video encoder rate."""
-        log.info('set video encoder rate (cmd=0x%02x seq=%04x)' %
-                 (VIDEO_ENCODER_RATE_CMD, self.pkt_seq_num))
+        log.info('set video encoder rate (cmd=0x%02x seq=%04x)', VIDEO_ENCODER_RATE_CMD, self.pkt_seq_num)
         self.video_encoder_rate = rate
         return self.__send_video_encoder_rate()
 
@@ -254,32 +308,32 @@ class Tello(object):
 
     def up(self, val):
         """Up tells the drone to ascend. Pass in an int from 0-100."""
-        log.info('up(val=%d)' % val)
+        log.info('up(val=%d)', val)
         self.left_y = val / 100.0
 
     def down(self, val):
         """Down tells the drone to descend. Pass in an int from 0-100."""
-        log.info('down(val=%d)' % val)
+        log.info('down(val=%d)', val)
         self.left_y = val / 100.0 * -1
 
     def forward(self, val):
         """Forward tells the drone to go forward. Pass in an int from 0-100."""
-        log.info('forward(val=%d)' % val)
+        log.info('forward(val=%d)', val)
         self.right_y = val / 100.0
 
     def backward(self, val):
         """Backward tells the drone to go in reverse. Pass in an int from 0-100."""
-        log.info('backward(val=%d)' % val)
+        log.info('backward(val=%d)', val)
         self.right_y = val / 100.0 * -1
 
     def right(self, val):
         """Right tells the drone to go right. Pass in an int from 0-100."""
-        log.info('right(val=%d)' % val)
+        log.info('right(val=%d)', val)
         self.right_x = val / 100.0
 
     def left(self, val):
         """Left tells the drone to go left. Pass in an int from 0-100."""
-        log.info('left(val=%d)' % val)
+        log.info('left(val=%d)', val)
         self.right_x = val / 100.0 * -1
 
     def clockwise(self, val):
@@ -287,7 +341,7 @@ class Tello(object):
         Clockwise tells the drone to rotate in a clockwise direction.
         Pass in an int from 0-100.
         """
-        log.info('clockwise(val=%d)' % val)
+        log.info('clockwise(val=%d)', val)
         self.left_x = val / 100.0
 
     def counter_clockwise(self, val):
@@ -295,12 +349,12 @@ class Tello(object):
         CounterClockwise tells the drone to rotate in a counter-clockwise direction.
         Pass in an int from 0-100.
         """
-        log.info('counter_clockwise(val=%d)' % val)
+        log.info('counter_clockwise(val=%d)', val)
         self.left_x = val / 100.0 * -1
 
     def flip_forward(self):
         """flip_forward tells the drone to perform a forwards flip"""
-        log.info('flip_forward (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_forward (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipFront)
         pkt.fixup()
@@ -308,7 +362,7 @@ class Tello(object):
 
     def flip_back(self):
         """flip_back tells the drone to perform a backwards flip"""
-        log.info('flip_back (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_back (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipBack)
         pkt.fixup()
@@ -316,7 +370,7 @@ class Tello(object):
 
     def flip_right(self):
         """flip_right tells the drone to perform a right flip"""
-        log.info('flip_right (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_right (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipRight)
         pkt.fixup()
@@ -324,7 +378,7 @@ class Tello(object):
 
     def flip_left(self):
         """flip_left tells the drone to perform a left flip"""
-        log.info('flip_left (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_left (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipLeft)
         pkt.fixup()
@@ -332,7 +386,7 @@ class Tello(object):
 
     def flip_forwardleft(self):
         """flip_forwardleft tells the drone to perform a forwards left flip"""
-        log.info('flip_forwardleft (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_forwardleft (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipForwardLeft)
         pkt.fixup()
@@ -340,7 +394,7 @@ class Tello(object):
 
     def flip_backleft(self):
         """flip_backleft tells the drone to perform a backwards left flip"""
-        log.info('flip_backleft (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_backleft (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipBackLeft)
         pkt.fixup()
@@ -348,7 +402,7 @@ class Tello(object):
 
     def flip_forwardright(self):
         """flip_forwardright tells the drone to perform a forwards right flip"""
-        log.info('flip_forwardright (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_forwardright (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipForwardRight)
         pkt.fixup()
@@ -356,7 +410,7 @@ class Tello(object):
 
     def flip_backright(self):
         """flip_backleft tells the drone to perform a backwards right flip"""
-        log.info('flip_backright (cmd=0x%02x seq=0x%04x)' % (FLIP_CMD, self.pkt_seq_num))
+        log.info('flip_backright (cmd=0x%02x seq=0x%04x)', FLIP_CMD, self.pkt_seq_num)
         pkt = Packet(FLIP_CMD, 0x70)
         pkt.add_byte(FlipBackLeft)
         pkt.fixup()
@@ -375,7 +429,7 @@ class Tello(object):
         Pass in an int from -1.0 ~ 1.0. (positive value means upward)
         """
         if self.left_y != self.__fix_range(throttle):
-            log.info('set_throttle(val=%4.2f)' % throttle)
+            log.info('set_throttle(val=%4.2f)', throttle)
         self.left_y = self.__fix_range(throttle)
 
     def set_yaw(self, yaw):
@@ -384,7 +438,7 @@ class Tello(object):
         Pass in an int from -1.0 ~ 1.0. (positive value will make the drone turn to the right)
         """
         if self.left_x != self.__fix_range(yaw):
-            log.info('set_yaw(val=%4.2f)' % yaw)
+            log.info('set_yaw(val=%4.2f)', yaw)
         self.left_x = self.__fix_range(yaw)
 
     def set_pitch(self, pitch):
@@ -393,7 +447,7 @@ class Tello(object):
         Pass in an int from -1.0 ~ 1.0. (positive value will make the drone move forward)
         """
         if self.right_y != self.__fix_range(pitch):
-            log.info('set_pitch(val=%4.2f)' % pitch)
+            log.info('set_pitch(val=%4.2f)', pitch)
         self.right_y = self.__fix_range(pitch)
 
     def set_roll(self, roll):
@@ -402,53 +456,20 @@ class Tello(object):
         Pass in an int from -1.0 ~ 1.0. (positive value will make the drone move to the right)
         """
         if self.right_x != self.__fix_range(roll):
-            log.info('set_roll(val=%4.2f)' % roll)
+            log.info('set_roll(val=%4.2f)', roll)
         self.right_x = self.__fix_range(roll)
 
-    def __send_stick_command(self):
-        pkt = Packet(STICK_CMD, 0x60)
-
-        axis1 = int(1024 + 660.0 * self.right_x) & 0x7ff
-        axis2 = int(1024 + 660.0 * self.right_y) & 0x7ff
-        axis3 = int(1024 + 660.0 * self.left_y) & 0x7ff
-        axis4 = int(1024 + 660.0 * self.left_x) & 0x7ff
-        '''
-        11 bits (-1024 ~ +1023) x 4 axis = 44 bits
-        44 bits will be packed in to 6 bytes (48 bits)
-
-                    axis4      axis3      axis2      axis1
-             |          |          |          |          |
-                 4         3         2         1         0
-        98765432109876543210987654321098765432109876543210
-         |       |       |       |       |       |       |
-             byte5   byte4   byte3   byte2   byte1   byte0
-        '''
-        log.debug("stick command: yaw=%4d thr=%4d pit=%4d rol=%4d" %
-                  (axis4, axis3, axis2, axis1))
-        log.debug("stick command: yaw=%04x thr=%04x pit=%04x rol=%04x" %
-                  (axis4, axis3, axis2, axis1))
-        pkt.add_byte(((axis2 << 11 | axis1) >> 0) & 0xff)
-        pkt.add_byte(((axis2 << 11 | axis1) >> 8) & 0xff)
-        pkt.add_byte(((axis3 << 11 | axis2) >> 5) & 0xff)
-        pkt.add_byte(((axis4 << 11 | axis3) >> 2) & 0xff)
-        pkt.add_byte(((axis4 << 11 | axis3) >> 10) & 0xff)
-        pkt.add_byte(((axis4 << 11 | axis3) >> 18) & 0xff)
-        pkt.add_time()
-        pkt.fixup()
-        log.debug("stick command: %s" % byte_to_hexstring(pkt.get_buffer()))
-        return self.send_packet(pkt)
-
     def send_packet(self, pkt):
         """Send_packet is used to send a command packet to the drone."""
         try:
             cmd = pkt.get_buffer()
             self.sock.sendto(cmd, self.tello_addr)
-            log.debug("send_packet: %s" % byte_to_hexstring(cmd))
+            log.debug("send_packet: %s", HexString(cmd))
         except socket.error as err:
             if self.state == self.STATE_CONNECTED:
-                log.error("send_packet: %s" % str(err))
+                log.error("send_packet: %s", err)
             else:
-                log.info("send_packet: %s" % str(err))
+                log.info("send_packet: %s", err)
             return False
 
         return True
@@ -463,108 +484,118 @@ class Tello(object):
             data = bytearray([x for x in data])
 
         if str(data[0:9]) == 'conn_ack:' or data[0:9] == b'conn_ack:':
-            log.info('connected. (port=%2x%2x)' % (data[9], data[10]))
-            log.debug('    %s' % byte_to_hexstring(data))
+            log.info('connected. (port=%2x%2x)', data[9], data[10])
+            log.debug('    %s', HexString(data))
             if self.video_enabled:
                 self.__send_exposure()
                 self.__send_video_encoder_rate()
                 self.__send_start_video()
-            self.__publish(self.__EVENT_CONN_ACK, data)
+            self.__publish(self.__EVENT_CONN_ACK, bytes(data))
 
             return True
 
         if data[0] != START_OF_PACKET:
-            log.info('start of packet != %02x (%02x) (ignored)' % (START_OF_PACKET, data[0]))
-            log.info('    %s' % byte_to_hexstring(data))
-            log.info('    %s' % str(map(chr, data))[1:-1])
+            log.info('start of packet != %02x (%02x) (ignored)', START_OF_PACKET, data[0])
+            log.info('    %s', HexString(data))
+            log.info('    %s', str(map(chr, data))[1:-1])
             return False
 
-        pkt = Packet(data)
         cmd = uint16(data[5], data[6])
         if cmd == LOG_MSG:
-            log.debug("recv: log: %s" % byte_to_hexstring(data[9:]))
-            self.__publish(event=self.EVENT_LOG, data=data[9:])
+            log.debug("recv: log: %s", HexString(data[9:]))
+            self.__publish(event=self.EVENT_LOG, data=bytes(data[9:]))
         elif cmd == WIFI_MSG:
-            log.debug("recv: wifi: %s" % byte_to_hexstring(data[9:]))
+            log.debug("recv: wifi: %s", HexString(data[9:]))
             self.wifi_strength = data[9]
-            self.__publish(event=self.EVENT_WIFI, data=data[9:])
+            self.__publish(event=self.EVENT_WIFI, data=bytes(data[9:]))
         elif cmd == LIGHT_MSG:
-            log.debug("recv: light: %s" % byte_to_hexstring(data[9:]))
-            self.__publish(event=self.EVENT_LIGHT, data=data[9:])
+            log.debug("recv: light: %s", HexString(data[9:]))
+            self.__publish(event=self.EVENT_LIGHT, data=bytes(data[9:]))
         elif cmd == FLIGHT_MSG:
             flight_data = FlightData(data[9:])
             flight_data.wifi_strength = self.wifi_strength
-            log.debug("recv: flight data: %s" % str(flight_data))
+            log.debug("recv: flight data: %s", flight_data)
             self.__publish(event=self.EVENT_FLIGHT_DATA, data=flight_data)
         elif cmd == TIME_CMD:
-            log.debug("recv: time data: %s" % byte_to_hexstring(data))
-            self.__publish(event=self.EVENT_TIME, data=data[7:9])
+            log.debug("recv: time data: %s", HexString(data))
+            self.__publish(event=self.EVENT_TIME, data=bytes(data[7:9]))
         elif cmd in (TAKEOFF_CMD, LAND_CMD, VIDEO_START_CMD, VIDEO_ENCODER_RATE_CMD, PALM_LAND_CMD,
                      EXPOSURE_CMD):
-            log.info("recv: ack: cmd=0x%02x seq=0x%04x %s" %
-                     (uint16(data[5], data[6]), uint16(data[7], data[8]), byte_to_hexstring(data)))
+            log.info("recv: ack: cmd=0x%02x seq=0x%04x %s",
+                     uint16(data[5], data[6]), uint16(data[7], data[8]), HexString(data))
         elif cmd == TELLO_CMD_FILE_SIZE:
             # Drone is about to send us a file. Get ready.
             # N.b. one of the fields in the packet is a file ID; by demuxing
-            # based on file ID we can receive multiple files at once. This
-            # code doesn't support that yet, though, so don't take one photo
-            # while another is still being received.
-            log.info("recv: file size: %s" % byte_to_hexstring(data))
+            # based on file ID we receive multiple files at once, e.g. a burst
+            # of photos.
+            log.info("recv: file size: %s", HexString(data))
+            pkt = Packet(bytes(data))
             if len(pkt.get_data()) >= 7:
-                (size, filenum) = struct.unpack('<xLH', pkt.get_data())
-                log.info('      file size: num=%d bytes=%d' % (filenum, size))
-                # Initialize file download state.
-                self.file_recv[filenum] = DownloadedFile(filenum, size)
+                (size, filenum) = codec.FILE_SIZE.unpack_from(pkt.get_data())
+                log.info('      file size: num=%d bytes=%d', filenum, size)
+                # Initialize file download state, unless the drone repeats the size of a file being received.
+                file = self.file_recv.get(filenum)
+                if file is None or file.size != size:
+                    self.file_recv[filenum] = DownloadedFile(filenum, size)
             else:
                 # We always seem to get two files, one with most of the payload missing.
                 # Not sure what the second one is for.
-                log.warn('      file size: payload too small: %s' % byte_to_hexstring(pkt.get_data()))
+                log.warn('      file size: payload too small: %s', HexString(pkt.get_data()))
             # Ack the packet.
             self.send_packet(pkt)
         elif cmd == TELLO_CMD_FILE_DATA:
-            # log.info("recv: file data: %s" % byte_to_hexstring(data[9:21]))
+            # log.info("recv: file data: %s", HexString(data[9:21]))
             # Drone is sending us a fragment of a file it told us to prepare
             # for earlier.
-            self.recv_file_data(pkt.get_data())
+            self.recv_file_data(memoryview(data)[9:len(data)-2])
         else:
-            log.info('unknown packet: %04x %s' % (cmd, byte_to_hexstring(data)))
+            log.info('unknown packet: %04x %s', cmd, HexString(data))
             return False
 
         return True
 
     def recv_file_data(self, data):
-        (filenum,chunk,fragment,size) = struct.unpack('<HLLH', data[0:12])
+        (filenum, chunk, fragment, size) = codec.FILE_DATA.unpack_from(data)
         file = self.file_recv.get(filenum, None)
 
         # Preconditions.
         if file is None:
             return
 
-        if file.recvFragment(chunk, fragment, size, data[12:12+size]):
+        if file.recvFragment(chunk, fragment, size, data[12:]):
             # Did this complete a chunk? Ack the chunk so the drone won't
-            # re-send it.
-            self.send_packet_data(TELLO_CMD_FILE_DATA, type=0x50,
-                payload=struct.pack('<BHL', 0, filenum, chunk))
+            # re-send it. The acks go out together once the burst of file
+            # data is over, see the idle callback of the io loop.
+            self.file_acks.append(codec.FILE_ACK.pack(0, filenum, chunk))
+            if self.FILE_ACK_BATCH <= len(self.file_acks):
+                self.__send_file_acks()
 
         if file.done():
+            self.__send_file_acks()
             # We have the whole file! First, send a normal ack with the first
             # byte set to 1 to indicate file completion.
             self.send_packet_data(TELLO_CMD_FILE_DATA, type=0x50,
-                payload=struct.pack('<BHL', 1, filenum, chunk))
+                payload=codec.FILE_ACK.pack(1, filenum, chunk))
             # Then send the FILE_COMPLETE packed separately telling it how
             # large we thought the file was.
             self.send_packet_data(TELLO_CMD_FILE_COMPLETE, type=0x48,
-                payload=struct.pack('<HL', filenum, file.size))
+                payload=codec.FILE_COMPLETE.pack(filenum, file.size))
             # Inform subscribers that we have a file and clean up.
             self.__publish(event=self.EVENT_FILE_RECEIVED, data=file.data())
             del self.file_recv[filenum]
 
+    def __send_file_acks(self):
+        acks = self.file_acks
+        self.file_acks = []
+        for payload in acks:
+            self.send_packet_data(TELLO_CMD_FILE_DATA, type=0x50, payload=payload)
+
     def __state_machine(self, event, sender, data, **args):
         self.lock.acquire()
         cur_state = self.state
         event_connected = False
         event_disconnected = False
-        log.debug('event %s in state %s' % (str(event), str(self.state)))
+        log.debug('event %s in state %s', event, self.state)
 
         if self.state == self.STATE_DISCONNECTED:
             if event == self.__EVENT_CONN_REQ:
@@ -601,7 +632,7 @@ class Tello(object):
             pass
 
         if cur_state != self.state:
-            log.info('state transit %s -> %s' % (cur_state, self.state))
+            log.info('state transit %s -> %s', cur_state, self.state)
         self.lock.release()
 
         if event_connected:
@@ -611,113 +642,152 @@ class Tello(object):
             self.__publish(event=self.EVENT_DISCONNECTED, **args)
             self.connected.clear()
 
-    def __recv_thread(self):
-        sock = self.sock
+    def __io_thread(self):
+        self.loop.run(lambda: self.state != self.STATE_QUIT)
+        self.stick.stop()
+        self.loop.close()
+        self.video_sock.close()
+        log.info('exit from the io thread.')
 
-        while self.state != self.STATE_QUIT:
-
-            if self.state == self.STATE_CONNECTED:
-                self.__send_stick_command()  # ignore errors
+    def __check_recv_timeout(self):
+        now = time.monotonic()
+        if now - self.recv_time < self.RECV_TIMEOUT:
+            return
+        self.recv_time = now
+        if self.state == self.STATE_CONNECTED:
+            log.error('recv: timeout')
+        self.__publish(event=self.__EVENT_TIMEOUT)
+
+    def __recv_packets(self):
+        # The packets are parsed in place, __process_packet copies what it publishes
+        deadline = time.monotonic() + self.MAX_READ_TIME
+        while True:
+            try:
+                size, server = self.sock.recvfrom_into(self.recv_buffer)
+            except BlockingIOError:
+                return
+            except Exception as ex:
+                log.error('recv: %s', ex)
+                return
 
+            self.recv_time = time.monotonic()
+            data = self.recv_view[:size]
             try:
-                data, server = sock.recvfrom(self.udpsize)
-                log.debug("recv: %s" % byte_to_hexstring(data))
+                log.debug("recv: %s", HexString(data))
                 self.__process_packet(data)
-            except socket.timeout as ex:
-                if self.state == self.STATE_CONNECTED:
-                    log.error('recv: timeout')
-                self.__publish(event=self.__EVENT_TIMEOUT)
             except Exception as ex:
-                log.error('recv: %s' % str(ex))
+                log.error('recv: %s', ex)
                 show_exception(ex)
+            if deadline < time.monotonic():
+                return
 
-        log.info('exit from the recv thread.')
+    def __request_key_frame(self, now):
+        if (self.key_frame_request_time is not None and
+                (now - self.key_frame_request_time).total_seconds() < self.KEY_FRAME_REQUEST_INTERVAL):
+            return
+        log.info('video recv: loss, request a key frame')
+        self.key_frame_request_time = now
+        self.__send_start_video()
 
-    def __video_thread(self):
-        log.info('start video thread')
-        # Create a UDP socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        port = 6038
-        sock.bind(('', port))
-        sock.settimeout(5.0)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 512 * 1024)
-        log.info('video receive buffer size = %d' %
-                 sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
-
-        prev_video_data = None
-        prev_ts = None
-        history = []
-        while self.state != self.STATE_QUIT:
-            if not self.video_enabled:
-                time.sleep(1.0)
-                continue
+    def __recv_video_packets(self):
+        deadline = time.monotonic() + self.MAX_READ_TIME
+        while True:
             try:
-                data, server = sock.recvfrom(self.udpsize)
-                now = datetime.datetime.now()
-                log.debug("video recv: %s %d bytes" % (byte_to_hexstring(data[0:2]), len(data)))
-                show_history = False
-
-                # check video data loss
-                video_data = VideoData(data)
-                loss = video_data.gap(prev_video_data)
-                if loss != 0:
-                    self.video_data_loss += loss
-                    # enable this line to see packet history
-                    # show_history = True
-                prev_video_data = video_data
-
-                # check video data interval
-                if prev_ts is not None and 0.1 < (now - prev_ts).total_seconds():
-                    log.info('video recv: %d bytes %02x%02x +%03d' %
-                             (len(data), byte(data[0]), byte(data[1]),
-                              (now - prev_ts).total_seconds() * 1000))
-                prev_ts = now
-
-                # save video data history
-                history.append([now, len(data), byte(data[0])*256 + byte(data[1])])
-                if 100 < len(history):
-                    history = history[1:]
-
-                # show video data history
-                if show_history:
-                    prev_ts = history[0][0]
-                    for i in range(1, len(history)):
-                        [ ts, sz, sn ] = history[i]
-                        print('    %02d:%02d:%02d.%03d %4d bytes %04x +%03d%s' %
-                              (ts.hour, ts.minute, ts.second, ts.microsecond/1000,
-                               sz, sn, (ts - prev_ts).total_seconds()*1000,
-                               (' *' if i == len(history) - 1 else '')))
-                        prev_ts = ts
-                    history = history[-1:]
-
-                # deliver video frame to subscribers
-                self.__publish(event=self.EVENT_VIDEO_FRAME, data=data[2:])
-                self.__publish(event=self.EVENT_VIDEO_DATA, data=data)
-
-                # show video frame statistics
-                if self.prev_video_data_time is None:
-                    self.prev_video_data_time = now
-                self.video_data_size += len(data)
-                dur = (now - self.prev_video_data_time).total_seconds()
-                if 2.0 < dur:
-                    log.info(('video data %d bytes %5.1fKB/sec' %
-                              (self.video_data_size, self.video_data_size / dur / 1024)) +
-                             ((' loss=%d' % self.video_data_loss) if self.video_data_loss != 0 else ''))
-                    self.video_data_size = 0
-                    self.prev_video_data_time = now
-                    self.video_data_loss = 0
-
-                    # keep sending start video command
-                    self.__send_start_video()
-
-            except socket.timeout as ex:
-                log.error('video recv: timeout')
-                data = None
+                size, server = self.video_sock.recvfrom_into(self.video_buffer)
+            except BlockingIOError:
+                return
             except Exception as ex:
-                log.error('video recv: %s' % str(ex))
-                show_exception(ex)
+                log.error('video recv: %s', ex)
+                return
+
+            self.video_recv_time = time.monotonic()
+            if self.video_enabled:
+                try:
+                    # The subscribers may keep the packet
+                    self.__process_video_packet(self.video_view[:size].tobytes())
+                except Exception as ex:
+                    log.error('video recv: %s', ex)
+                    show_exception(ex)
+            if deadline < time.monotonic():
+                return
+
+    def __process_video_packet(self, data):
+        now = datetime.datetime.now()
+        log.debug("video recv: %s %d bytes", HexString(data[0:2]), len(data))
+        show_history = False
+
+        # check video data loss
+        video_data = VideoData(data)
+        loss = video_data.gap(self.prev_video_data)
+        if loss != 0:
+            self.video_data_loss += loss
+            # enable this line to see packet history
+            # show_history = True
+        self.prev_video_data = video_data
+
+        # check video data interval
+        prev_ts = self.prev_video_ts
+        if prev_ts is not None and 0.1 < (now - prev_ts).total_seconds():
+            log.info('video recv: %d bytes %02x%02x +%03d',
+                     len(data), byte(data[0]), byte(data[1]), (now - prev_ts).total_seconds() * 1000)
+        self.prev_video_ts = now
+
+        # save video data history
+        history = self.video_history
+        history.append([now, len(data), byte(data[0])*256 + byte(data[1])])
+        if 100 < len(history):
+            del history[0]
+
+        # show video data history
+        if show_history:
+            prev_ts = history[0][0]
+            for i in range(1, len(history)):
+                [ ts, sz, sn ] = history[i]
+                print('    %02d:%02d:%02d.%03d %4d bytes %04x +%03d%s' %
+                      (ts.hour, ts.minute, ts.second, ts.microsecond/1000,
+                       sz, sn, (ts - prev_ts).total_seconds()*1000,
+                       (' *' if i == len(history) - 1 else '')))
+                prev_ts = ts
+            del history[:-1]
+
+        # assemble whole frames, after a loss ask for a key frame instead of waiting for the next one
+        assembler = self.video_assembler
+        losses = assembler.losses
+        frame = assembler.add(data)
+        if assembler.losses != losses:
+            self.__request_key_frame(now)
+
+        # deliver video frame to subscribers
+        self.__publish(event=self.EVENT_VIDEO_FRAME, data=data[2:])
+        self.__publish(event=self.EVENT_VIDEO_DATA, data=data)
+        if frame is not None:
+            self.__publish(event=self.EVENT_VIDEO_ACCESS_UNIT, data=frame)
+
+        if self.prev_video_data_time is None:
+            self.prev_video_data_time = now
+        self.video_data_size += len(data)
+
+    def __video_keep_alive(self):
+        if not self.video_enabled:
+            return
 
-        log.info('exit from the video thread.')
+        if time.monotonic() - self.video_recv_time > self.VIDEO_TIMEOUT:
+            log.error('video recv: timeout')
+            self.video_recv_time = time.monotonic()
+
+        # show video frame statistics, over one second at least
+        now = datetime.datetime.now()
+        dur = (now - self.prev_video_data_time).total_seconds() if self.prev_video_data_time is not None else 0
+        if 1.0 <= dur:
+            log.info('video data %d bytes %5.1fKB/sec%s',
+                     self.video_data_size, self.video_data_size / dur / 1024,
+                     (' loss=%d' % self.video_data_loss) if self.video_data_loss != 0 else '')
+            self.video_data_size = 0
+            self.prev_video_data_time = now
+            self.video_data_loss = 0
+
+        # keep sending start video command
+        self.__send_start_video()
 
 if __name__ == '__main__':
     print('You can use test.py for testing.')
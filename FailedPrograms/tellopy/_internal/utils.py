@@ -17,10 +17,10 @@ def uint16(val0, val1):
 
 
 def int16(val0, val1):
-    if (val1 & 0xff) is not 0:
-        return ((val0 & 0xff) | ((val1 & 0xff) << 8)) - 0x10000
-    else:
-        return (val0 & 0xff) | ((val1 & 0xff) << 8)
+    val = (val0 & 0xff) | ((val1 & 0xff) << 8)
+    if val & 0x8000:
+        return val - 0x10000
+    return val
 
 
 def byte_to_hexstring(buf):
@@ -30,6 +30,20 @@ def byte_to_hexstring(buf):
     return ''.join(["%02x " % ord(chr(x)) for x in buf]).strip()
 
 
+class HexString(object):
+    """
+    Lazy byte_to_hexstring() for log arguments: the hex string is only built if the
+    message is actually logged, e.g. log.debug('recv: %s', HexString(data))
+    """
+    __slots__ = ('buf',)
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __str__(self):
+        return byte_to_hexstring(self.buf)
+
+
 def show_exception(ex):
     exc_type, exc_value, exc_traceback = sys.exc_info()
     traceback.print_exception(exc_type, exc_value, exc_traceback)
@@ -1,68 +1,121 @@
 import threading
+from collections import deque
 from . protocol import *
 
 
 class VideoStream(object):
+    """
+    File-like buffer of the H.264 stream, read by a decoder such as av.open(stream).
+
+    The video thread appends the whole frames of the drone's VideoFrameAssembler to a
+    deque and the decoder consumes them with read() or readinto(), so both ends are
+    O(1) per frame and the data is copied once, into the decoder's buffer. The writer
+    only takes the lock to wake up a waiting reader.
+    """
+    MAX_BUFFERED = 4 * 1024 * 1024  # bytes, new frames are dropped up to the next key frame beyond that
+
     def __init__(self, drone):
         self.drone = drone
         self.log = drone.log
         self.cond = threading.Condition()
-        self.queue = []
+        self.chunks = deque()
+        self.offset = 0  # bytes of chunks[0] already read
+        self.bytes_in = 0  # only updated by the writer
+        self.bytes_out = 0  # only updated by the reader
+        self.wanted = 0  # bytes asked by the waiting reader, 0 when no reader waits
         self.closed = False
-        self.prev_video_data = None
-        self.wait_first_packet_in_frame = True
-        self.ignore_packets = 0
+        self.wait_key_frame = True
         self.name = 'VideoStream'
+
+        # Statistics
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.overflows = 0
+
         drone.subscribe(drone.EVENT_CONNECTED, self.__handle_event)
         drone.subscribe(drone.EVENT_DISCONNECTED, self.__handle_event)
-        drone.subscribe(drone.EVENT_VIDEO_DATA, self.__handle_event)
+        drone.subscribe(drone.EVENT_VIDEO_ACCESS_UNIT, self.__handle_event)
 
-    def read(self, size):
-        self.cond.acquire()
-        try:
-            if len(self.queue) == 0 and not self.closed:
+    def buffered(self):
+        return self.bytes_in - self.bytes_out
+
+    def get_stats(self):
+        return {
+            'buffered': self.buffered(),
+            'received': self.frames_received,
+            'dropped': self.frames_dropped,
+            'overflows': self.overflows,
+        }
+
+    def __wait(self, size):
+        if self.chunks or self.closed:
+            return
+        with self.cond:
+            self.wanted = size
+            if not self.chunks and not self.closed:
                 self.cond.wait(5.0)
-            data = bytes()
-            while 0 < len(self.queue) and len(data) + len(self.queue[0]) < size:
-                data = data + self.queue[0]
-                del self.queue[0]
-        finally:
-            self.cond.release()
+            self.wanted = 0
+
+    def readinto(self, buf):
+        """
+        Copy up to len(buf) buffered bytes into buf, waiting for the first packet if
+        the buffer is empty. Returns the number of bytes copied, 0 at the end of stream.
+        """
+        out = memoryview(buf).cast('B')
+        self.__wait(len(out))
+        chunks = self.chunks
+        size = 0
+        while chunks and size < len(out):
+            chunk = chunks[0]
+            n = min(len(chunk) - self.offset, len(out) - size)
+            out[size:size + n] = chunk[self.offset:self.offset + n]
+            size += n
+            self.offset += n
+            if self.offset == len(chunk):
+                chunks.popleft()
+                self.offset = 0
+        self.bytes_out += size
+        return size
+
+    def read(self, size):
+        buf = bytearray(size)
+        n = self.readinto(buf)
+        del buf[n:]
         # returning data of zero length indicates end of stream
-        self.log.debug('%s.read(size=%d) = %d' % (self.name, size, len(data)))
-        return data
+        self.log.debug('%s.read(size=%d) = %d', self.name, size, n)
+        return bytes(buf)
 
     def seek(self, offset, whence):
-        self.log.info('%s.seek(%d, %d)' % (str(self.name), offset, whence))
+        self.log.info('%s.seek(%d, %d)', self.name, offset, whence)
         return -1
 
+    def __append(self, frame):
+        chunk = memoryview(frame)
+        self.chunks.append(chunk)
+        self.bytes_in += len(chunk)
+        if self.wanted:
+            with self.cond:
+                self.cond.notify()
+
     def __handle_event(self, event, sender, data):
         if event is self.drone.EVENT_CONNECTED:
-            self.log.info('%s.handle_event(CONNECTED)' % (self.name))
+            self.log.info('%s.handle_event(CONNECTED)', self.name)
         elif event is self.drone.EVENT_DISCONNECTED:
-            self.log.info('%s.handle_event(DISCONNECTED)' % (self.name))
-            self.cond.acquire()
-            self.queue = []
-            self.closed = True
-            self.cond.notifyAll()
-            self.cond.release()
-        elif event is self.drone.EVENT_VIDEO_DATA:
-            self.log.debug('%s.handle_event(VIDEO_DATA, size=%d)' % (self.name, len(data)))
-            video_data = VideoData(data)
-            if 0 < video_data.gap(self.prev_video_data):
-                self.wait_first_packet_in_frame = True
-                
-            self.prev_video_data = video_data
-            if self.wait_first_packet_in_frame and byte(data[1]) != 0:
-                self.ignore_packets += 1
+            self.log.info('%s.handle_event(DISCONNECTED)', self.name)
+            # The reader gets the end of stream once it has read the buffered frames
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+        elif event is self.drone.EVENT_VIDEO_ACCESS_UNIT:
+            self.log.debug('%s.handle_event(VIDEO_ACCESS_UNIT, size=%d)', self.name, len(data))
+            self.frames_received += 1
+            if not self.wait_key_frame and self.MAX_BUFFERED < self.buffered():
+                # The decoder can't keep up: drop up to the next key frame rather than grow without bound
+                self.overflows += 1
+                self.wait_key_frame = True
+            if self.wait_key_frame and (self.MAX_BUFFERED < self.buffered() or not is_key_frame(data)):
+                self.frames_dropped += 1
                 return
-            if self.wait_first_packet_in_frame:
-                self.log.debug('%s.handle_event(VIDEO_DATA): ignore %d packets' %
-                               (self.name, self.ignore_packets))
-            self.ignore_packets = 0
-            self.wait_first_packet_in_frame = False
+            self.wait_key_frame = False
 
-            self.cond.acquire()
-            self.queue.append(data[2:])
-            self.cond.notifyAll()
-            self.cond.release()
+            self.__append(data)
@@ -10,6 +10,7 @@ tellopy sample using joystick and video palyer
 import time
 import sys
 import tellopy
+from tellopy._internal import logger
 import pygame
 import pygame.locals
 from subprocess import Popen, PIPE
@@ -257,6 +258,8 @@ def handle_input_event(drone, e):
 
 
 def main():
+    # Write the drone's log from a background thread, the video and the display don't wait for stdout
+    logger.start_listener()
     global buttons
     pygame.init()
     pygame.joystick.init()
@@ -284,8 +287,8 @@ def main():
     drone = tellopy.Tello()
     drone.connect()
     drone.start_video()
-    drone.subscribe(drone.EVENT_FLIGHT_DATA, handler)
-    drone.subscribe(drone.EVENT_VIDEO_FRAME, handler)
+    drone.subscribe(drone.EVENT_FLIGHT_DATA, handler, background=True)
+    drone.subscribe(drone.EVENT_VIDEO_FRAME, handler, background=True)
 
     try:
         while 1:
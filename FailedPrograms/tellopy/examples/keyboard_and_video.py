@@ -21,6 +21,7 @@ Controls:
 import time
 import sys
 import tellopy
+from tellopy._internal import logger
 import pygame
 import pygame.display
 import pygame.key
@@ -250,6 +251,8 @@ def handleFileReceived(event, sender, data):
     status_print('Saved photo to %s' % path)
 
 def main():
+    # Write the drone's log from a background thread, the video and the display don't wait for stdout
+    logger.start_listener()
     pygame.init()
     pygame.display.init()
     pygame.display.set_mode((1280, 720))
@@ -266,8 +269,8 @@ def main():
     drone = tellopy.Tello()
     drone.connect()
     drone.start_video()
-    drone.subscribe(drone.EVENT_FLIGHT_DATA, flightDataHandler)
-    drone.subscribe(drone.EVENT_VIDEO_FRAME, videoFrameHandler)
+    drone.subscribe(drone.EVENT_FLIGHT_DATA, flightDataHandler, background=True)
+    drone.subscribe(drone.EVENT_VIDEO_FRAME, videoFrameHandler, background=True)
     drone.subscribe(drone.EVENT_FILE_RECEIVED, handleFileReceived)
     speed = 30
 
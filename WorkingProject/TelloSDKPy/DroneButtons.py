@@ -7,6 +7,18 @@ import cv2 as cv
 import numpy as np
 import pygame
 from djitellopy import Tello
+from djitellopy.batching import BatchDetector
+from djitellopy.control import RCControlLoop
+from djitellopy.display import FrameDisplay
+from djitellopy.frames import FramePool
+from djitellopy.inference import InferenceScheduler
+from djitellopy.log import start_logging
+from djitellopy.model import DetectorModel
+from djitellopy.pipeline import Pipeline, DROP_OLDEST
+from djitellopy.recorder import H264Recorder
+from djitellopy.tracking import ObjectTracker
+from djitellopy.video import low_latency_available
+from djitellopy.workers import ProcessDetector
 from pygame.locals import *
 
 
@@ -14,12 +26,34 @@ from pygame.locals import *
 S = 60
 # Frames per second of the pygame window display
 FPS = 25
+# RC commands sent per second
+RC_RATE = 20
 # video_output = None
 
 CONFIG_FILE = "yolov3.cfg"
 # download this file from: https://pjreddie.com/media/files/yolov3.weights
 WEIGHTS_FILE = "yolov3.weights"
 CLASSES_FILE = "yolov3.classes"
+# Threads feeding the detector, their frames are batched in one forward pass. A batch holds at most one frame per
+# thread, so 1 disables batching: it is the right choice for a single drone, whose InferenceScheduler spaces the
+# frames by more than the detector latency anyway. Raise it when the detector keeps up with the camera, e.g. on a GPU
+# with INFERENCE_MIN_RATE set high, or to share the detector between several drones
+INFERENCE_WORKERS = 1
+# Maximum number of seconds a frame waits for the others of its batch
+BATCH_LATENCY = 0.05
+# Worker processes running the detector, so inference doesn't starve the RC control thread. 0 runs it in this
+# process. Use at least as many INFERENCE_WORKERS to keep them all busy
+DETECTOR_PROCESSES = 0
+# Seconds the detect stage waits for a free detector slot, then for the detections, before giving up on a frame
+DETECT_TIMEOUT = 5.0
+# Minimum number of inferences per second, even if the scene does not move
+INFERENCE_MIN_RATE = 1
+# Frames with the detections drawn, held by the display and recorder queues
+OVERLAY_POOL_SIZE = 8
+# The H.264 stream of the drone is written as it is received, without re-encoding (needs PyAV). None to disable
+RECORD_FILE = "myvideo.mkv"
+# Also encode the frames with the detections drawn, at the cost of CPU. None to disable
+OVERLAY_RECORD_FILE = None
 
 xboxControls = [0, 1, 2, 3, 4, 5, 8, 9, 11, 12, 13, 14]
 inFlightControls = [0, 1, 2, 3, 11, 12, 13, 14]
@@ -49,6 +83,15 @@ class FrontEnd(object):
 
         pygame.display.set_caption("Tello video stream")
         self.screen = pygame.display.set_mode([960, 720])
+        self.display = FrameDisplay(self.screen, FPS)
+
+        # Load the detector before the flight, on the fastest backend and warmed up
+        if DETECTOR_PROCESSES:
+            self.detector = ProcessDetector(WEIGHTS_FILE, CONFIG_FILE, workers=DETECTOR_PROCESSES).start()
+        else:
+            self.model = DetectorModel.get_model(WEIGHTS_FILE, CONFIG_FILE)
+            print(self.model)
+            self.detector = BatchDetector(self.model, max_batch=INFERENCE_WORKERS, max_latency=BATCH_LATENCY).start()
 
         # Init Tello object that interacts with the Tello drone
         self.tello = Tello()
@@ -62,8 +105,8 @@ class FrontEnd(object):
 
         self.send_rc_control = False
 
-        # create update timer
-        pygame.time.set_timer(USEREVENT + 1, 50)
+        # Sends the velocities to Tello at a fixed rate, whatever the event loop is doing
+        self.control = RCControlLoop(self.tello, RC_RATE)
 
     def run(self):
 
@@ -88,6 +131,7 @@ class FrontEnd(object):
         # frame_read = self.tello.get_frame_read()
         # print("got this tello frame and put it into pygame")
 
+        self.display.start()
         threading.Thread(target=self.runVideo).start()
 
         for i in range(0, pygame.joystick.get_count()):
@@ -98,13 +142,12 @@ class FrontEnd(object):
         # print a statement telling what the name of the controller is
             print ("Detected joystick '", joysticks[-1].get_name(), "'")
 
+        self.control.start()
         self.should_stop = False
         while not self.should_stop:
 
             for event in pygame.event.get():
-                if event.type == USEREVENT + 1:
-                    self.update()
-                elif event.type == QUIT:
+                if event.type == QUIT:
                     self.should_stop = True
                 elif event.type == JOYBUTTONDOWN:
                     if event.button == 4:
@@ -114,127 +157,115 @@ class FrontEnd(object):
                 elif event.type == JOYBUTTONUP:
                     self.buttonup(event.button)
 
-            self.screen.fill([0, 0, 0])
-
+            self.update()
             time.sleep(1 / FPS)
 
         # Call it always before finishing. I deallocate resources.
+        self.control.stop()
+        print(self.control.get_stats())
+        self.display.stop()
         self.tello.end()
 
 
     def runVideo(self):
         print("starting video")
-        # cap = self.tello.get_video_capture(args["video"])
-        cap = self.tello.get_video_capture()
+        # The low latency reader needs PyAV, it gives access to the raw stream for the recorder
+        frame_read = self.tello.get_frame_read(low_latency=RECORD_FILE is not None or low_latency_available())
+        recorder = None
+        if RECORD_FILE is not None:
+            recorder = H264Recorder(RECORD_FILE).start()
+            frame_read.add_sink(recorder.write)
 
         classes = None
         with open(CLASSES_FILE, 'r') as f:
             classes = [line.strip() for line in f.readlines()]
 
-        # define the codec and create VideoWriter object
-        scale = 0.00392
-        fourcc = cv.VideoWriter_fourcc(*'MP4V')
-        out = cv.VideoWriter('myvideo.mp4', fourcc, 1, (640, 480))
-        net = cv.dnn.readNet(WEIGHTS_FILE, CONFIG_FILE)
-        frameCounter = 0;
-
-        while cap.isOpened() and not self.should_stop:
-            ret, frame = cap.read()
-            status = "No Targets"
-            if ret:
-
-                frameCounter += 1
-
-                # Run analysis every second.
-                if frameCounter%30 == 0:
-                    blob = cv.dnn.blobFromImage(frame, scale, (416, 416), (0, 0, 0), True, crop=False)
-                    net.setInput(blob)
-
-                    frame = self.run_inference(net, frame, classes)
-
-                    displayFrame = cv.flip(frame, 90)
-                    displayFrame = np.rot90(displayFrame)
-                    displayFrame = cv.cvtColor(displayFrame, cv.COLOR_BGR2RGB)
-
-                    pygameFrame = pygame.surfarray.make_surface(displayFrame)
-                    self.screen.blit(pygameFrame, (0, 0))
-                    pygame.display.update()
-
-                    frame = cv.resize(frame, (640, 480))
-                    out.write(frame)
+        out = None
+        if OVERLAY_RECORD_FILE is not None:
+            # define the codec and create VideoWriter object
+            fourcc = cv.VideoWriter_fourcc(*'MP4V')
+            out = cv.VideoWriter(OVERLAY_RECORD_FILE, fourcc, FPS, (640, 480))
+
+        # Runs the detector as often as the measured latency and the free CPU allow, skipping still frames
+        scheduler = InferenceScheduler(max_rate=30, min_rate=INFERENCE_MIN_RATE)
+        # Follows the detected objects between two inferences, so every displayed frame gets its boxes
+        self.tracker = ObjectTracker()
+        # Number of the last captured frame, and pool of the frames with the detections drawn, so the decoded frames
+        # are never modified
+        state = {'last_frame': 0, 'overlays': None}
+        recordFrame = np.empty((480, 640, 3), np.uint8)
+
+        def capture():
+            pooled = frame_read.wait_frame(state['last_frame'])
+            if pooled is not None:
+                state['last_frame'] = pooled.number
+            return pooled
+
+        def detect(pooled):
+            if not scheduler.should_run(pooled.array):
+                return
+            future = self.detector.submit(pooled.array, timeout=DETECT_TIMEOUT)
+            if future is None:
+                # The detector is busy, skip this frame
+                return
+            self.tracker.update(future.result(timeout=DETECT_TIMEOUT))
+            if future.latency is not None:
+                # Detector time per frame of the batch
+                scheduler.add_latency(future.latency / future.batch_size)
+
+        def overlay(pooled):
+            if state['overlays'] is None or state['overlays'].shape != pooled.array.shape:
+                state['overlays'] = FramePool(pooled.array.shape, size=OVERLAY_POOL_SIZE)
+            drawn = state['overlays'].get_free()
+            if drawn is None:
+                return None
+            drawn.array[...] = pooled.array
+            for track_id, class_id, confidence, x, y, w, h in self.tracker.predict():
+                self.draw_bounding_box(drawn.array, classes, class_id, confidence, round(x), round(y), round(x + w),
+                                       round(y + h), track_id)
+            return drawn
+
+        def show(drawn):
+            self.display.submit(drawn.array)
+
+        def record(drawn):
+            cv.resize(drawn.array, (640, 480), recordFrame)
+            out.write(recordFrame)
+
+        # Display and recording run at camera rate with the newest detections, inference at its own rate
+        pipeline = Pipeline()
+        pipeline.add_stage('capture', capture)
+        pipeline.add_stage('detect', detect, after='capture', maxsize=1, policy=DROP_OLDEST,
+                           workers=INFERENCE_WORKERS)
+        pipeline.add_stage('overlay', overlay, after='capture', maxsize=1, policy=DROP_OLDEST)
+        pipeline.add_stage('display', show, after='overlay', maxsize=1, policy=DROP_OLDEST)
+        if out is not None:
+            pipeline.add_stage('record', record, after='overlay', maxsize=4, policy=DROP_OLDEST)
+        pipeline.start()
 
-
-                if cv.waitKey(1) & 0xFF == ord('q'):
-                    break
-            else:
-                break
-
-        cap.release()
-        out.release()
-        cv.destroyAllWindows()
-
-    def get_output_layers(self, net):
-        layer_names = net.getLayerNames()
-        output_layers = [layer_names[i[0] - 1] for i in net.getUnconnectedOutLayers()]
-        return output_layers
-
-    def draw_bounding_box(self, frame, classes, class_id, confidence, x, y, x_plus_w, y_plus_h):
+        while not self.should_stop:
+            time.sleep(0.1)
+
+        pipeline.stop()
+        self.detector.stop()
+        print(pipeline.get_stats())
+        print(scheduler.get_stats())
+        print(self.detector.get_stats())
+        if recorder is not None:
+            frame_read.remove_sink(recorder.write)
+            recorder.stop()
+            print(recorder.get_stats())
+        if out is not None:
+            out.release()
+
+    def draw_bounding_box(self, frame, classes, class_id, confidence, x, y, x_plus_w, y_plus_h, track_id=None):
         label = str(classes[class_id] + str(confidence))
+        if track_id is not None:
+            label = '#' + str(track_id) + ' ' + label
         frame = cv.rectangle(frame, (x, y), (x_plus_w, y_plus_h), [255, 0, 0], 2)
         frame = cv.putText(frame, label, (x - 10, y - 10), cv.FONT_HERSHEY_SIMPLEX, 0.5, [255, 0, 0], 2)
         return frame
 
-    def run_inference(self, net, frame, classes):
-        Width = frame.shape[1]
-        Height = frame.shape[0]
-
-        # run inference through the network
-        # and gather predictions from output layers
-        outs = net.forward(self.get_output_layers(net))
-
-        # initialization
-        class_ids = []
-        confidences = []
-        boxes = []
-        conf_threshold = 0.5
-        nms_threshold = 0.4
-
-        # for each detetion from each output layer
-        # get the confidence, class id, bounding box params
-        # and ignore weak detections (confidence < 0.5)
-        for out in outs:
-            for detection in out:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                if confidence > 0.5:
-                    center_x = int(detection[0] * Width)
-                    center_y = int(detection[1] * Height)
-                    w = int(detection[2] * Width)
-                    h = int(detection[3] * Height)
-                    x = center_x - w / 2
-                    y = center_y - h / 2
-                    class_ids.append(class_id)
-                    confidences.append(float(confidence))
-                    boxes.append([x, y, w, h])
-
-        # apply non-max suppression
-        indices = cv.dnn.NMSBoxes(boxes, confidences, conf_threshold, nms_threshold)
-
-        # go through the detections remaining
-        # after nms and draw bounding box
-        for i in indices:
-            i = i[0]
-            box = boxes[i]
-            x = box[0]
-            y = box[1]
-            w = box[2]
-            h = box[3]
-
-            frame = self.draw_bounding_box(frame, classes, class_ids[i], confidences[i], round(x), round(y), round(x + w), round(y + h))
-
-        return frame
-
     def buttondown(self, button):
         """ Update velocities based on key pressed
         Arguments:
@@ -278,14 +309,17 @@ class FrontEnd(object):
             self.send_rc_control = False
 
     def update(self):
-        """ Update routine. Send velocities to Tello."""
+        """ Update routine. Give the velocities to the control loop, which sends them to Tello."""
         if self.send_rc_control:
-            self.tello.send_rc_control(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
-                                       self.yaw_velocity)
+            self.control.set(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
+                             self.yaw_velocity)
+        else:
+            self.control.clear()
 
 
 def main():
 
+        start_logging()
         frontend = FrontEnd()
         frontend.run()
 
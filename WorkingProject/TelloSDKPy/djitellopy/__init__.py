@@ -1 +1,3 @@
 from djitellopy.tello import Tello, BackgroundFrameRead
+from djitellopy.async_tello import AsyncTello
+from djitellopy.swarm import TelloSwarm
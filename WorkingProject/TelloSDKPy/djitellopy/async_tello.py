@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+
+from djitellopy.decorators import accepts
+from djitellopy.scheduler import CommandStats
+from djitellopy.state import StateProtocol
+from djitellopy.tello import Tello
+
+log = logging.getLogger(__name__)
+
+
+class TelloProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol of the Tello command port. Responses are queued until AsyncTello reads them."""
+
+    def __init__(self):
+        self.transport = None
+        self.responses = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.responses.put_nowait(data)
+
+    def error_received(self, exc):
+        log.error('%s', exc)
+
+    def clear(self):
+        """Discard the responses nobody is waiting for, e.g. late responses of commands that timed out."""
+        while not self.responses.empty():
+            self.responses.get_nowait()
+
+
+class AsyncTello(Tello):
+    """asyncio version of Tello. It sends the same commands with the same validation than Tello, but every method
+    that waits for a response of the drone is a coroutine:
+
+        tello = AsyncTello()
+        await tello.connect()
+        await tello.takeoff()
+        battery = await tello.get_battery()
+
+    The state of the drones is received on the same event loop and read by the get_* coroutines without querying the
+    drone, like Tello does. No thread is started and no socket blocks, so one event loop can drive several drones,
+    each one created with its own host and local_port. Commands of a drone are sent one at a time, TIME_BTW_COMMANDS
+    seconds after the previous response. send_rc_control is not a coroutine, as it does not wait for a response.
+    """
+
+    def __init__(self, host=Tello.UDP_IP, local_port=Tello.UDP_PORT):
+        self.address = (host, self.UDP_PORT)
+        self.local_port = local_port
+        self.protocol = None
+        self.state_receiver = None
+        self.lock = None
+        self.last_response_time = 0
+        self.stats = {}
+        self.stream_on = False
+        self.callbacks = []
+
+    async def open(self):
+        """Create the UDP endpoint of the command port. connect() calls it, so there is usually no need to."""
+        if self.protocol is None:
+            loop = asyncio.get_event_loop()
+            _, self.protocol = await loop.create_datagram_endpoint(TelloProtocol,
+                                                                   local_addr=('0.0.0.0', self.local_port))
+            self.lock = asyncio.Lock()
+
+            try:
+                self.state_receiver = await StateProtocol.get_receiver(self.STATE_UDP_PORT)
+            except OSError as e:
+                log.warning('Could not listen to the state of Tello: %s', e)
+
+    async def transmit_command(self, command):
+        """Send command to Tello and wait for its response, once the previous command has been answered.
+        Return:
+            str: response of Tello
+            False: timeout
+        """
+        await self.open()
+        async with self.lock:
+            wait = self.last_response_time + self.TIME_BTW_COMMANDS - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            log.info('Send command: %s', command)
+
+            self.protocol.clear()
+            sent = time.monotonic()
+            self.protocol.transport.sendto(command.encode('utf-8'), self.address)
+
+            try:
+                response = await asyncio.wait_for(self.protocol.responses.get(), self.RESPONSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                response = None
+            self.last_response_time = time.monotonic()
+
+            stats = self.get_stats(command)
+            if response is None:
+                stats.add_timeout()
+                log.warning('Timeout exceed on command %s', command)
+                return False
+            stats.add(self.last_response_time - sent)
+
+            log.info('Response: %s', response)
+
+            return response.decode('utf-8')
+
+    async def read_state(self, get_value, command, parse_response=None):
+        """Read a value from the last state received from Tello, or query it. See Tello.read_state."""
+        value = self.state_value(self.get_state(), get_value)
+        if value is not None:
+            return value
+        return self.parse_read_response(await self.send_read_command(command), parse_response)
+
+    def get_stats(self, command):
+        name = command.split(' ')[0]
+        if name not in self.stats:
+            self.stats[name] = CommandStats(name)
+        return self.stats[name]
+
+    def get_command_stats(self):
+        """Get the latency statistics of the commands sent so far
+        Returns:
+            dict: CommandStats by command name, e.g. 'forward'
+        """
+        return dict(self.stats)
+
+    @accepts(command=str)
+    async def send_command_with_return(self, command):
+        """Send command to Tello and wait for its response.
+        Return:
+            str: response of Tello
+            False: timeout
+        """
+        return await self.transmit_command(command)
+
+    @accepts(command=str)
+    def send_command_async(self, command):
+        """Schedule a command on the event loop without waiting for its response.
+        Return:
+            Task: resolved with the response of Tello, False on timeout
+        """
+        return asyncio.ensure_future(self.send_command_with_return(command))
+
+    @accepts(command=str)
+    def send_command_without_return(self, command):
+        """Send command to Tello without expecting a response. See Tello.send_command_without_return."""
+        if self.protocol is None:
+            log.error('Command %s was not sent. Call connect() first', command)
+            return
+
+        log.debug('Send command (no expect response): %s', command)
+        self.protocol.transport.sendto(command.encode('utf-8'), self.address)
+
+    def send_rc_command(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Send RC control right away, without print. See Tello.send_rc_command."""
+        if self.protocol is None:
+            return
+        command = 'rc %s %s %s %s' % (left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+        self.protocol.transport.sendto(command.encode('utf-8'), self.address)
+
+    @accepts(command=str)
+    async def send_control_command(self, command):
+        """Send control command to Tello and wait for its response. See Tello.send_control_command.
+        Return:
+            bool: True for successful, False for unsuccessful
+        """
+        response = await self.send_command_with_return(command)
+        return self.control_command_result(command, response)
+
+    @accepts(command=str)
+    def send_control_command_async(self, command):
+        """Schedule a control command on the event loop without waiting for its response.
+        Return:
+            Task: resolved with True for successful, False for unsuccessful
+        """
+        return asyncio.ensure_future(self.send_control_command(command))
+
+    @accepts(command=str)
+    async def send_read_command(self, command):
+        """Send read command to Tello and wait for its response. See Tello.send_read_command.
+        Return:
+            int or str: value read
+            False: unsuccessful
+        """
+        response = await self.send_command_with_return(command)
+        return self.read_command_result(command, response)
+
+    async def connect(self):
+        """Open the command port and entry SDK mode
+        Returns:
+            bool: True for successful, False for unsuccessful
+        """
+        await self.open()
+        return await super(AsyncTello, self).connect()
+
+    async def streamon(self):
+        """Set video stream on. See Tello.streamon.
+        Returns:
+            bool: True for successful, False for unsuccessful
+        """
+        result = await self.send_control_command("streamon")
+        if result is True:
+            self.stream_on = True
+        return result
+
+    async def streamoff(self):
+        """Set video stream off
+        Returns:
+            bool: True for successful, False for unsuccessful
+        """
+        result = await self.send_control_command("streamoff")
+        if result is True:
+            self.stream_on = False
+        return result
+
+    async def stop_video_capture(self):
+        return await self.streamoff()
+
+    async def end(self):
+        """Call this method when you want to end the tello object"""
+        if self.stream_on:
+            await self.streamoff()
+        if self.background_frame_read is not None:
+            self.background_frame_read.stop()
+        if self.cap is not None:
+            self.cap.release()
+        if self.protocol is not None:
+            self.protocol.transport.close()
+            self.protocol = None
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchDetector:
+    """Run a DetectorModel on batches of frames, from several drones or several threads, with one forward pass per
+    batch instead of one per frame.
+
+    submit() queues a frame and returns a Future resolved with its detections. The detector thread takes the first
+    queued frame, then waits at most max_latency seconds for more frames to fill the batch, and runs the batch as soon
+    as it holds max_batch frames. The frame must not be modified until the Future is done.
+
+    Besides the detections, every Future has the attributes batch_size (number of frames of its batch) and latency
+    (seconds taken by the batch, None if the detector was stopped before running it).
+
+    A batch only holds several frames if they are submitted at about the same time: from several drones sharing the
+    detector, or from several threads each waiting for its own Future. A single thread that waits for every result
+    gets batches of one frame, so give it max_batch=1 to skip the max_latency wait.
+    """
+
+    def __init__(self, model, max_batch=4, max_latency=0.05, conf_threshold=0.5, nms_threshold=0.4):
+        """
+        Arguments:
+            model: DetectorModel, only used by the detector thread
+            max_batch: maximum number of frames per forward pass
+            max_latency: maximum number of seconds the first frame of a batch waits for the other ones
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.conf_threshold = conf_threshold
+        self.nms_threshold = nms_threshold
+        self.queue = queue.Queue()
+        self.stopped = True
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.batches = 0
+        self.frames = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        self.stopped = False
+        thread = threading.Thread(target=self.run, args=())
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def submit(self, frame, timeout=None):
+        """Queue a BGR frame for detection. Raises RuntimeError if the detector is not started or was stopped.
+        timeout is accepted for the interface of ProcessDetector.submit(), the queue never blocks.
+        Returns:
+            Future: resolved with the list of (class_id, confidence, x, y, w, h) of the detections
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        # Under the lock, so stop() can't miss a frame queued while it empties the queue
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError('BatchDetector is not running')
+            self.queue.put((frame, future))
+        return future
+
+    def collect(self):
+        # Wait for the first frame, then fill the batch until max_batch frames or the latency cap
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not self.stopped:
+            batch = self.collect()
+            if not batch:
+                continue
+
+            frames = [frame for frame, future in batch]
+            start = time.monotonic()
+            try:
+                results = self.model.detect_batch(frames, self.conf_threshold, self.nms_threshold)
+            except Exception as e:
+                for frame, future in batch:
+                    future.set_exception(e)
+                continue
+            latency = time.monotonic() - start
+
+            with self.lock:
+                self.batches += 1
+                self.frames += len(batch)
+                self.busy_time += latency
+
+            for (frame, future), detections in zip(batch, results):
+                future.batch_size = len(batch)
+                future.latency = latency
+                future.set_result(detections)
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+        # Don't leave the callers of the queued frames waiting
+        while True:
+            try:
+                frame, future = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            future.batch_size = 0
+            future.latency = None
+            future.set_result([])
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: batches run, frames detected, mean batch size and frames per second of detector time
+        """
+        with self.lock:
+            return {
+                'batches': self.batches,
+                'frames': self.frames,
+                'mean_batch': self.frames / self.batches if self.batches else None,
+                'fps': self.frames / self.busy_time if self.busy_time else None,
+            }
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class RCControlLoop:
+    """Send the RC stick state to Tello at a fixed rate from a dedicated thread, independently of the UI event loop.
+
+    set() only stores the latest stick state: calls between two ticks are coalesced, so the drone always gets the
+    newest one and never a backlog. Ticks follow a monotonic clock with absolute deadlines, so the rate doesn't drift
+    with the time taken by each tick. A tick that starts more than one period late counts as a deadline miss and the
+    missed ticks are skipped rather than sent in a burst.
+
+    The UI must call set() regularly, e.g. once per frame, even when the sticks don't move: a state older than
+    stale_timeout is treated as a hung UI and the loop sends hover (0, 0, 0, 0) until the next set() or clear().
+
+        control = RCControlLoop(tello, rate=20).start()
+        control.set(0, 30, 0, 0)
+        ...
+        control.stop()
+    """
+
+    STALE_PERIODS = 5  # default stale_timeout, in periods of the loop
+
+    def __init__(self, tello, rate=20, stale_timeout=None):
+        """
+        Arguments:
+            tello: Tello
+            rate: rc commands per second
+            stale_timeout: seconds without set() before the loop sends hover, STALE_PERIODS periods by default
+        """
+        self.tello = tello
+        self.period = 1.0 / rate
+        self.stale_timeout = stale_timeout if stale_timeout is not None else self.STALE_PERIODS * self.period
+        self.lock = threading.Lock()
+        self.state = None
+        self.state_time = 0.0
+        self.stale = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # Statistics
+        self.ticks = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.stale_ticks = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+        self.updates = 0
+
+    def set(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Set the stick state sent from the next tick on. Velocities are between -100 and 100"""
+        with self.lock:
+            if self.updates:
+                self.coalesced += 1
+            self.updates += 1
+            self.state = (left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+            self.state_time = time.monotonic()
+
+    def clear(self):
+        """Stop sending rc commands until the next set(), e.g. while landed"""
+        with self.lock:
+            self.state = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        deadline = time.monotonic()
+        while not self.stop_event.is_set():
+            delay = deadline - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+
+            now = time.monotonic()
+            lateness = now - deadline
+            with self.lock:
+                state = self.state
+                stale = state is not None and now - self.state_time > self.stale_timeout
+                if stale:
+                    state = (0, 0, 0, 0)
+                    self.stale_ticks += 1
+                self.updates = 0
+                self.ticks += 1
+                self.total_lateness += lateness
+                self.max_lateness = max(self.max_lateness, lateness)
+                if lateness > self.period:
+                    self.misses += 1
+
+            if stale != self.stale:
+                self.stale = stale
+                if stale:
+                    log.warning('No stick state for %.2f s, sending hover until the next update', self.stale_timeout)
+                else:
+                    log.info('Stick state updated again, resuming')
+
+            if state is not None:
+                try:
+                    self.tello.send_rc_command(*state)
+                    with self.lock:
+                        self.sent += 1
+                except Exception as e:
+                    log.error('RC command failed: %s', e)
+
+            # Next deadline on the grid of the period, skipping the ticks that were missed
+            deadline += self.period
+            now = time.monotonic()
+            if now > deadline:
+                deadline += self.period * int((now - deadline) / self.period + 1)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(1.0)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: ticks, rc commands sent, stick updates coalesced, deadline misses, ticks that sent hover because the
+                stick state was stale, mean and max lateness (s)
+        """
+        with self.lock:
+            return {
+                'ticks': self.ticks,
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'stale': self.stale_ticks,
+                'mean_lateness': self.total_lateness / self.ticks if self.ticks else None,
+                'max_lateness': self.max_lateness,
+            }
@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+
+def decode_yolo(outs, width, height, conf_threshold=0.5):
+    """Decode the outputs of a YOLO net in one pass over all the output layers, instead of one Python iteration per
+    detection row.
+    Arguments:
+        outs: outputs of net.forward(), one array per output layer with rows
+            (center_x, center_y, w, h, objectness, class scores...) relative to the image size
+        width: width of the image in pixels
+        height: height of the image in pixels
+        conf_threshold: minimum class score of the detections kept
+
+    Returns:
+        boxes: float32 array (N, 4) of (x, y, w, h) in pixels
+        confidences: float32 array (N,)
+        class_ids: int32 array (N,)
+    """
+    detections = outs[0] if len(outs) == 1 else np.concatenate(outs, axis=0)
+    scores = detections[:, 5:]
+
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    mask = confidences > conf_threshold
+
+    # Same truncation of the center and size to whole pixels as the per row decoding
+    kept = detections[mask, :4]
+    centers_x = np.trunc(kept[:, 0] * width)
+    centers_y = np.trunc(kept[:, 1] * height)
+    w = np.trunc(kept[:, 2] * width)
+    h = np.trunc(kept[:, 3] * height)
+
+    boxes = np.empty((len(kept), 4), np.float32)
+    boxes[:, 0] = centers_x - w / 2
+    boxes[:, 1] = centers_y - h / 2
+    boxes[:, 2] = w
+    boxes[:, 3] = h
+
+    return boxes, np.ascontiguousarray(confidences[mask], np.float32), class_ids[mask].astype(np.int32)
+
+
+def detect_objects(outs, width, height, conf_threshold=0.5, nms_threshold=0.4):
+    """Decode the outputs of a YOLO net and apply non-max suppression.
+    Arguments:
+        outs: outputs of net.forward()
+        width: width of the image in pixels
+        height: height of the image in pixels
+        conf_threshold: minimum class score of the detections kept
+        nms_threshold: maximum overlap between two kept boxes
+
+    Returns:
+        list: (class_id, confidence, x, y, w, h) of the detections kept
+    """
+    boxes, confidences, class_ids = decode_yolo(outs, width, height, conf_threshold)
+    if not len(boxes):
+        return []
+
+    # Older OpenCV versions return the indices as a (N, 1) array
+    indices = np.asarray(cv2.dnn.NMSBoxes(boxes, confidences, conf_threshold, nms_threshold)).reshape(-1)
+
+    return [(int(class_ids[i]), float(confidences[i]), float(boxes[i, 0]), float(boxes[i, 1]), float(boxes[i, 2]),
+             float(boxes[i, 3])) for i in indices]
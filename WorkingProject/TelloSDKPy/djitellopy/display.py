@@ -0,0 +1,81 @@
+import threading
+
+import pygame
+
+# pygame 2 reads BGR buffers directly, older versions need the frame transposed into a surface
+BGR_BUFFER = pygame.version.vernum[0] >= 2
+
+
+class FrameDisplay:
+    """Show the Tello frames on a pygame window at its own frame rate.
+
+    submit() copies a BGR frame into one persistent surface in a single pass, instead of the cv.flip, np.rot90,
+    cv.cvtColor and pygame.surfarray.make_surface copies. The display thread started by start() blits the newest
+    submitted frame to the screen fps times per second, so the window keeps refreshing whatever the thread that
+    submits frames (e.g. a detector) is doing. The frame can be reused by the caller as soon as submit() returns.
+    """
+
+    def __init__(self, screen, fps=30, position=(0, 0)):
+        """
+        Arguments:
+            screen: pygame display surface
+            fps: display frame rate
+            position: top left corner of the frames on the screen
+        """
+        self.screen = screen
+        self.fps = fps
+        self.position = position
+        self.surface = None
+        self.lock = threading.Lock()
+        self.stopped = True
+
+        # Statistics
+        self.submitted_frames = 0
+        self.shown_frames = 0
+        self.last_shown = 0
+
+    def submit(self, frame):
+        """Copy a BGR frame (numpy array, height x width x 3) into the display surface"""
+        height, width = frame.shape[:2]
+        with self.lock:
+            if self.surface is None or self.surface.get_size() != (width, height):
+                self.surface = pygame.Surface((width, height), depth=24)
+
+            if BGR_BUFFER and frame.flags['C_CONTIGUOUS']:
+                self.surface.blit(pygame.image.frombuffer(frame, (width, height), 'BGR'), (0, 0))
+            else:
+                # Fused transpose and BGR to RGB copy into the pixels of the surface
+                pixels = pygame.surfarray.pixels3d(self.surface)
+                pixels[...] = frame.transpose(1, 0, 2)[..., ::-1]
+                del pixels
+
+            self.submitted_frames += 1
+
+    def show(self):
+        """Blit the newest submitted frame to the screen and update the window, if it was not shown yet"""
+        with self.lock:
+            if self.surface is None or self.last_shown == self.submitted_frames:
+                return False
+            self.screen.blit(self.surface, self.position)
+            self.last_shown = self.submitted_frames
+
+        pygame.display.update()
+        self.shown_frames += 1
+        return True
+
+    def start(self):
+        """Show the submitted frames from a background thread, fps times per second"""
+        self.stopped = False
+        thread = threading.Thread(target=self.run, args=())
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def run(self):
+        clock = pygame.time.Clock()
+        while not self.stopped:
+            self.show()
+            clock.tick(self.fps)
+
+    def stop(self):
+        self.stopped = True
@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class PooledFrame:
+    """Preallocated frame buffer of a FramePool. Consumers borrow it from the pool and release it when they are done,
+    the pool only hands it to a writer again once nobody holds it. It can be used as a context manager:
+
+        with frame_read.borrow_frame() as frame:
+            process(frame)
+    """
+
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array
+        self.refs = 0
+        self.number = 0
+
+    def acquire(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.pool.lock:
+            self.pool.unref(self)
+
+    def __enter__(self):
+        return self.array
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FramePool:
+    """Ring of preallocated frames shared by a video decoder and its consumers, so no array is allocated per frame.
+
+    The decoder takes a free frame with get_free(), writes into its array and publishes it. Consumers get the newest
+    published frame with borrow_latest() and release it once done. A frame is reused when it is not the newest one
+    anymore and no consumer holds it.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=4):
+        """
+        Arguments:
+            shape: shape of the frames, e.g. (720, 960, 3)
+            size: number of frames. Must be greater than the number of frames held at the same time by consumers
+        """
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.shape = shape
+        self.frames = [PooledFrame(self, np.empty(shape, dtype)) for _ in range(size)]
+        self.free = deque(self.frames)
+        self.latest = None
+        self.published = 0
+        self.exhausted = 0
+
+    def get_free(self):
+        """Get a frame to write into. The caller holds it until it calls publish() or release().
+        Returns:
+            PooledFrame
+            None: all the frames are held by consumers
+        """
+        with self.lock:
+            if not self.free:
+                self.exhausted += 1
+                return None
+            frame = self.free.popleft()
+            frame.refs = 1
+            return frame
+
+    def publish(self, frame):
+        """Make frame the newest one. The reference of the writer is handed over to the pool."""
+        with self.lock:
+            self.published += 1
+            frame.number = self.published
+            previous = self.latest
+            self.latest = frame
+            if previous is not None:
+                self.unref(previous)
+            self.condition.notify_all()
+
+    def borrow_latest(self):
+        """Get the newest frame. Call release() on it once done.
+        Returns:
+            PooledFrame
+            None: no frame published yet
+        """
+        with self.lock:
+            frame = self.latest
+            if frame is not None:
+                frame.refs += 1
+            return frame
+
+    def wait_newer(self, number, timeout=None):
+        """Wait for a frame newer than the frame number, and borrow it. Call release() on it once done.
+        Returns:
+            PooledFrame: its number attribute is the number of the frame
+            None: timeout expired
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.published > number, timeout):
+                return None
+            self.latest.refs += 1
+            return self.latest
+
+    def unref(self, frame):
+        # Must be called with self.lock held
+        frame.refs -= 1
+        if frame.refs == 0:
+            self.free.append(frame)
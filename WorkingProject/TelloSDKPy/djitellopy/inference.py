@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class InferenceScheduler:
+    """Decide on which frames to run a detector, instead of running it every N frames.
+
+    The interval between two inferences is the measured detector latency divided by the share of the CPU the detector
+    may use, clipped between 1 / max_rate and 1 / min_rate. The share shrinks when other processes load the machine,
+    so a slow machine runs the detector less often and keeps time for the control loop, while a fast one runs it up
+    to max_rate. Frames that barely changed since the last inference are skipped too, but the detector still runs at
+    least min_rate times per second.
+
+        if scheduler.should_run(frame):
+            start = time.monotonic()
+            detections = detect(frame)
+            scheduler.add_latency(time.monotonic() - start)
+    """
+
+    # Weight of the newest latency in its moving average
+    LATENCY_SMOOTHING = 0.2
+    # Seconds between two reads of the system load
+    LOAD_PERIOD = 1.0
+    # Size of the grayscale thumbnails compared to measure the motion
+    MOTION_SIZE = (64, 48)
+
+    def __init__(self, max_rate=30, min_rate=1, cpu_share=0.5, motion_threshold=2.0):
+        """
+        Arguments:
+            max_rate: maximum number of inferences per second, usually the camera frame rate
+            min_rate: minimum number of inferences per second, even if nothing moves
+            cpu_share: share of one CPU the detector may use when the machine is idle, between 0 and 1
+            motion_threshold: mean absolute difference of the thumbnail pixels (0-255) under which a frame is skipped.
+                0 to never skip still frames
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.cpu_share = cpu_share
+        self.motion_threshold = motion_threshold
+        self.lock = threading.Lock()
+
+        self.latency = None
+        self.last_run = None
+        self.cpu_available = 1.0
+        self.load_time = None
+
+        self.thumbnail = np.empty((self.MOTION_SIZE[1], self.MOTION_SIZE[0], 3), np.uint8)
+        self.gray = np.empty((self.MOTION_SIZE[1], self.MOTION_SIZE[0]), np.uint8)
+        self.reference = None
+        self.motion = None
+
+        # Statistics
+        self.runs = 0
+        self.skipped_rate = 0
+        self.skipped_motion = 0
+
+    def get_interval(self):
+        """
+        Returns:
+            float: current minimum number of seconds between two inferences
+        """
+        interval = 1.0 / self.max_rate
+        if self.latency is not None:
+            interval = max(interval, self.latency / (self.cpu_share * self.cpu_available))
+        return min(interval, 1.0 / self.min_rate)
+
+    def update_cpu(self, now):
+        # The load average counts the detector too, only the load of the rest of the machine reduces its share
+        if not hasattr(os, 'getloadavg'):
+            return
+        if self.load_time is not None and now - self.load_time < self.LOAD_PERIOD:
+            return
+        self.load_time = now
+
+        cpus = os.cpu_count() or 1
+        detector_load = self.latency / self.get_interval() if self.latency is not None else 0.0
+        other_load = max(0.0, os.getloadavg()[0] - detector_load)
+        self.cpu_available = min(1.0, max(0.1, 1.0 - other_load / cpus))
+
+    def measure_motion(self, frame):
+        # Mean absolute difference between the thumbnails of frame and of the last inferred frame
+        cv2.resize(frame, self.MOTION_SIZE, self.thumbnail, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.thumbnail, cv2.COLOR_BGR2GRAY, self.gray)
+        if self.reference is None:
+            return None
+        return cv2.norm(self.gray, self.reference, cv2.NORM_L1) / self.gray.size
+
+    def should_run(self, frame):
+        """Tell if the detector should run on frame. Thread safe.
+        Arguments:
+            frame: BGR image (numpy array)
+
+        Returns:
+            bool
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.update_cpu(now)
+
+            elapsed = now - self.last_run if self.last_run is not None else None
+            if elapsed is not None and elapsed < self.get_interval():
+                self.skipped_rate += 1
+                return False
+
+            self.motion = self.measure_motion(frame)
+            if self.motion is not None and self.motion < self.motion_threshold and elapsed < 1.0 / self.min_rate:
+                self.skipped_motion += 1
+                return False
+
+            if self.reference is None:
+                self.reference = self.gray.copy()
+            else:
+                self.reference[...] = self.gray
+            self.last_run = now
+            self.runs += 1
+            return True
+
+    def add_latency(self, latency):
+        """Record how long an inference took, in seconds"""
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: inferences run, frames skipped because of the rate or the lack of motion, mean latency (s), current
+                rate (inferences per second) and available CPU share
+        """
+        with self.lock:
+            return {
+                'runs': self.runs,
+                'skipped_rate': self.skipped_rate,
+                'skipped_motion': self.skipped_motion,
+                'latency': self.latency,
+                'rate': 1.0 / self.get_interval(),
+                'cpu_available': self.cpu_available,
+            }
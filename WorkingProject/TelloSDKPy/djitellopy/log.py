@@ -0,0 +1,49 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+FORMAT = '%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s'
+DATE_FORMAT = '%H:%M:%S'
+
+listener = None
+
+
+def start_logging(level=logging.INFO, *handlers):
+    """Send the records of the djitellopy loggers to handlers from a background thread, so the threads that log
+    (command scheduler, receivers, rc loop) never wait for the console. Records below level are dropped before their
+    message is formatted. Without handlers, records are written to stdout.
+    Arguments:
+        level: logging level of the djitellopy loggers, e.g. logging.DEBUG to see every rc command
+        handlers: logging.Handler objects
+    """
+    global listener
+    stop_logging()
+    if not handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(FORMAT, DATE_FORMAT))
+        handlers = (handler,)
+
+    records = queue.Queue()
+    logger = logging.getLogger('djitellopy')
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(level)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+
+
+def stop_logging():
+    """Write the queued records and stop the background thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+atexit.register(stop_logging)
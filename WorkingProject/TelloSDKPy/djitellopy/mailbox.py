@@ -0,0 +1,37 @@
+import threading
+from collections import deque
+
+
+class ResponseMailbox:
+    """Thread safe mailbox where the UDP receiver thread posts the responses of Tello. Callers block on get() until
+    a response arrives or the timeout expires, instead of polling a shared attribute.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.responses = deque()
+
+    def post(self, response):
+        """Store a response and wake up the caller waiting for it. Called from the receiver thread."""
+        with self.condition:
+            self.responses.append(response)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next response.
+        Arguments:
+            timeout: seconds to wait. None waits forever.
+
+        Returns:
+            bytes: the oldest response not yet read
+            None: timeout expired
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.responses) > 0, timeout):
+                return None
+            return self.responses.popleft()
+
+    def clear(self):
+        """Discard the responses nobody is waiting for, e.g. late responses of commands that timed out."""
+        with self.condition:
+            self.responses.clear()
@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from djitellopy.detection import detect_objects
+
+log = logging.getLogger(__name__)
+
+# Backend and target pairs tried on the CPU, the fastest one available is used
+CPU_CANDIDATES = [
+    ('Inference Engine', 'DNN_BACKEND_INFERENCE_ENGINE', 'DNN_TARGET_CPU'),
+    ('OpenCV FP16', 'DNN_BACKEND_OPENCV', 'DNN_TARGET_CPU_FP16'),
+    ('OpenCV', 'DNN_BACKEND_OPENCV', 'DNN_TARGET_CPU'),
+]
+
+
+def get_candidates():
+    """
+    Returns:
+        list: (name, backend, target) of the CPU candidates this OpenCV build supports
+    """
+    candidates = []
+    for name, backend_name, target_name in CPU_CANDIDATES:
+        backend = getattr(cv2.dnn, backend_name, None)
+        target = getattr(cv2.dnn, target_name, None)
+        if backend is None or target is None:
+            continue
+        if hasattr(cv2.dnn, 'getAvailableTargets'):
+            try:
+                if target not in cv2.dnn.getAvailableTargets(backend):
+                    continue
+            except cv2.error:
+                continue
+        elif backend != cv2.dnn.DNN_BACKEND_OPENCV:
+            continue
+        candidates.append((name, backend, target))
+    return candidates
+
+
+class DetectorModel:
+    """cv2.dnn YOLO net loaded once, with its output layer names cached, running on the fastest CPU backend and
+    warmed up so the first frame of a flight is not slower than the next ones.
+
+    get_model() keeps one model per weights and config file, so restarting the video of a FrontEnd doesn't parse the
+    weights again. A cv2.dnn net must not be used by two threads at the same time: use copy() to get a model for
+    another thread, it skips the backend selection.
+    """
+
+    models = {}
+    models_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls, weights, config, backend=None, target=None, warmup=2):
+        """Get the model loaded from weights and config, loading it the first time.
+        Arguments:
+            weights: path of the weights file
+            config: path of the config file
+            backend: cv2.dnn.DNN_BACKEND_* to use, None to pick the fastest one
+            target: cv2.dnn.DNN_TARGET_* to use with backend
+            warmup: number of forward passes run after loading
+
+        Returns:
+            DetectorModel
+        """
+        key = (weights, config, backend, target)
+        with cls.models_lock:
+            if key not in cls.models:
+                cls.models[key] = DetectorModel(weights, config, backend, target, warmup)
+            return cls.models[key]
+
+    def __init__(self, weights, config, backend=None, target=None, warmup=2, input_size=(416, 416), scale=0.00392):
+        """
+        Arguments:
+            weights: path of the weights file
+            config: path of the config file
+            backend: cv2.dnn.DNN_BACKEND_* to use, None to pick the fastest one
+            target: cv2.dnn.DNN_TARGET_* to use with backend
+            warmup: number of forward passes run after loading
+            input_size: (width, height) of the input of the net
+            scale: factor applied to the pixels
+        """
+        self.weights = weights
+        self.config = config
+        self.input_size = input_size
+        self.scale = scale
+        self.warmup_passes = warmup
+        self.warmup_time = None
+        self.backend_name = None
+
+        start = time.monotonic()
+        self.net = cv2.dnn.readNet(weights, config)
+        self.load_time = time.monotonic() - start
+        self.output_layers = self.get_output_layers()
+
+        if backend is None:
+            self.backend_name, backend, target = self.choose_backend()
+        self.backend = backend
+        self.target = target
+        self.set_backend(backend, target)
+        self.warmup(warmup)
+
+    def get_output_layers(self):
+        if hasattr(self.net, 'getUnconnectedOutLayersNames'):
+            return list(self.net.getUnconnectedOutLayersNames())
+        layer_names = self.net.getLayerNames()
+        return [layer_names[i - 1] for i in np.asarray(self.net.getUnconnectedOutLayers()).reshape(-1)]
+
+    def set_backend(self, backend, target):
+        if backend is not None:
+            self.net.setPreferableBackend(backend)
+        if target is not None:
+            self.net.setPreferableTarget(target)
+
+    def choose_backend(self):
+        """Time a forward pass on every available CPU candidate.
+        Returns:
+            tuple: (name, backend, target) of the fastest one
+        """
+        candidates = get_candidates()
+        if len(candidates) < 2:
+            return candidates[0] if candidates else ('Default', None, None)
+
+        best = None
+        best_time = None
+        for candidate in candidates:
+            name, backend, target = candidate
+            try:
+                self.set_backend(backend, target)
+                # The first pass includes the setup of the backend
+                self.warmup(1)
+                start = time.monotonic()
+                self.warmup(1)
+                elapsed = time.monotonic() - start
+            except cv2.error as e:
+                log.warning('DNN backend %s unusable: %s', name, e)
+                continue
+            if best_time is None or elapsed < best_time:
+                best = candidate
+                best_time = elapsed
+
+        if best is None:
+            return 'Default', None, None
+        return best
+
+    def warmup(self, passes):
+        """Run forward passes on a black image"""
+        start = time.monotonic()
+        image = np.zeros((self.input_size[1], self.input_size[0], 3), np.uint8)
+        for _ in range(passes):
+            self.forward(image)
+        self.warmup_time = time.monotonic() - start
+
+    def forward(self, frame):
+        """Run the net on a BGR frame.
+        Returns:
+            list: outputs of the output layers
+        """
+        blob = cv2.dnn.blobFromImage(frame, self.scale, self.input_size, (0, 0, 0), True, crop=False)
+        self.net.setInput(blob)
+        return self.net.forward(self.output_layers)
+
+    def forward_batch(self, frames):
+        """Run the net on several BGR frames with a single forward pass, as a N x 3 x height x width blob.
+        Returns:
+            list: outputs of the output layers of every frame
+        """
+        blob = cv2.dnn.blobFromImages(frames, self.scale, self.input_size, (0, 0, 0), True, crop=False)
+        self.net.setInput(blob)
+        outs = self.net.forward(self.output_layers)
+        # Detection layers give either (N, rows, values) or the rows of all the frames one after the other
+        outs = [out.reshape(len(frames), -1, out.shape[-1]) for out in outs]
+        return [[out[i] for out in outs] for i in range(len(frames))]
+
+    def detect(self, frame, conf_threshold=0.5, nms_threshold=0.4):
+        """Run the net on a BGR frame and decode its outputs.
+        Returns:
+            list: (class_id, confidence, x, y, w, h) of the detections, see detect_objects()
+        """
+        outs = self.forward(frame)
+        return detect_objects(outs, frame.shape[1], frame.shape[0], conf_threshold, nms_threshold)
+
+    def detect_batch(self, frames, conf_threshold=0.5, nms_threshold=0.4):
+        """Run the net on several BGR frames with a single forward pass and decode its outputs.
+        Returns:
+            list: detections of every frame, see detect()
+        """
+        results = []
+        for frame, outs in zip(frames, self.forward_batch(frames)):
+            results.append(detect_objects(outs, frame.shape[1], frame.shape[0], conf_threshold, nms_threshold))
+        return results
+
+    def copy(self):
+        """Load another instance of the model for another thread, with the same backend and target"""
+        model = DetectorModel(self.weights, self.config, self.backend, self.target, self.warmup_passes,
+                              self.input_size, self.scale)
+        model.backend_name = self.backend_name
+        return model
+
+    def __str__(self):
+        return 'DetectorModel %s on %s, loaded in %.0f ms, warmed up in %.0f ms' % (
+            self.weights, self.backend_name or 'the requested backend', self.load_time * 1000,
+            (self.warmup_time or 0) * 1000)
@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# Drop policies of a StageQueue when it is full
+DROP_OLDEST = 'drop_oldest'  # make room for the new item, consumers always get the most recent items
+DROP_NEWEST = 'drop_newest'  # discard the new item
+BLOCK = 'block'  # wait until the consumer makes room
+
+log = logging.getLogger(__name__)
+
+
+def acquire(item):
+    if hasattr(item, 'acquire'):
+        item.acquire()
+
+
+def release(item):
+    if hasattr(item, 'release'):
+        item.release()
+
+
+class StageQueue:
+    """Bounded queue feeding a pipeline stage. Items with acquire() and release() methods, like the frames of a
+    FramePool, are released when they are dropped.
+    """
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('Unknown drop policy ' + str(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, applying the drop policy if the queue is full.
+        Returns:
+            bool: False if the item was dropped
+        """
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    release(self.items.popleft())
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST:
+                    release(item)
+                    self.dropped += 1
+                    return False
+                else:
+                    self.condition.wait_for(lambda: len(self.items) < self.maxsize or self.closed)
+
+            if self.closed:
+                release(item)
+                return False
+
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Take the oldest item.
+        Returns:
+            the item
+            None: timeout expired or queue closed
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """Wake up the producers and consumers and release the items left"""
+        with self.condition:
+            self.closed = True
+            while self.items:
+                release(self.items.popleft())
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Stage:
+    """Step of a Pipeline run on its own worker thread(s). A stage without input is a source: its function is called
+    in a loop and returns the next item, or None if there is none yet. It should block for a while when there is no
+    item, e.g. with BackgroundFrameRead.wait_frame(). Other stages call their function with every
+    item of their input queue. The non None results are put in the input queues of the following stages.
+
+    Items with acquire() and release() methods are reference counted: each output queue gets its own reference, and
+    the stage releases the item it received once its function returns.
+    """
+
+    def __init__(self, name, function, input=None, workers=1):
+        self.name = name
+        self.function = function
+        self.input = input
+        self.workers = workers
+        self.outputs = []
+        self.stopped = True
+        self.threads = []
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.processed = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        self.stopped = False
+        self.threads = [threading.Thread(target=self.run, args=(), name=self.name) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def run(self):
+        while not self.stopped:
+            if self.input is None:
+                item = None
+            else:
+                item = self.input.get(timeout=0.5)
+                if item is None:
+                    continue
+
+            start = time.monotonic()
+            try:
+                result = self.function(item) if self.input is not None else self.function()
+            except Exception as e:
+                log.error('Stage %s failed: %s', self.name, e)
+                result = None
+            finally:
+                if item is not None:
+                    release(item)
+
+            if self.input is not None or result is not None:
+                with self.lock:
+                    self.processed += 1
+                    self.busy_time += time.monotonic() - start
+
+            if result is not None:
+                self.emit(result)
+
+    def emit(self, result):
+        if not self.outputs:
+            release(result)
+            return
+        # The reference of the stage goes to the first queue, the other queues get their own
+        for queue in self.outputs[1:]:
+            acquire(result)
+        for queue in self.outputs:
+            queue.put(result)
+
+    def stop(self):
+        self.stopped = True
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: processed items, mean processing time (s), items dropped by the input queue and items waiting in it
+        """
+        with self.lock:
+            mean = self.busy_time / self.processed if self.processed else None
+            return {
+                'processed': self.processed,
+                'mean_time': mean,
+                'dropped': self.input.dropped if self.input is not None else 0,
+                'queued': len(self.input) if self.input is not None else 0,
+            }
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues, each stage running at its own rate:
+
+        pipeline = Pipeline()
+        pipeline.add_stage('capture', capture)
+        pipeline.add_stage('detect', detect, after='capture', maxsize=1, policy=DROP_OLDEST)
+        pipeline.add_stage('display', display, after='capture', maxsize=1, policy=DROP_OLDEST)
+        pipeline.start()
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add_stage(self, name, function, after=None, maxsize=1, policy=DROP_OLDEST, workers=1):
+        """Add a stage.
+        Arguments:
+            name: name of the stage
+            function: function(item) returning the item passed to the next stages, or None. function() for sources
+            after: name of the stage feeding this one, None for a source
+            maxsize: size of the input queue of the stage
+            policy: DROP_OLDEST, DROP_NEWEST or BLOCK, what to do when the input queue is full
+            workers: number of threads running function. function must be thread safe if more than 1
+
+        Returns:
+            Stage
+        """
+        if name in self.stages:
+            raise ValueError('Stage ' + name + ' already exists')
+
+        input = None
+        if after is not None:
+            input = StageQueue(maxsize, policy)
+            self.stages[after].outputs.append(input)
+
+        stage = Stage(name, function, input, workers)
+        self.stages[name] = stage
+        return stage
+
+    def start(self):
+        for stage in self.stages.values():
+            stage.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        for stage in self.stages.values():
+            stage.stop()
+            if stage.input is not None:
+                stage.input.close()
+        for stage in self.stages.values():
+            stage.join(timeout)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: stats of every stage, see Stage.get_stats
+        """
+        return dict((name, stage.get_stats()) for name, stage in self.stages.items())
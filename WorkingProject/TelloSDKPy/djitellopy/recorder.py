@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+
+try:
+    import av
+except ImportError:
+    av = None
+
+log = logging.getLogger(__name__)
+
+
+class H264Recorder:
+    """
+    Write the H.264 stream of Tello into a video file (MKV, MP4...) as it is received, without decoding or re-encoding
+    it: a full quality recording costs almost no CPU during the flight. The stream is split into frames and each frame
+    is timestamped with its arrival time, then muxed from a worker thread.
+
+    Feed it the raw stream with write(), e.g. from the video port through H264FrameRead:
+
+        recorder = H264Recorder('flight.mkv').start()
+        tello.get_frame_read(low_latency=True).add_sink(recorder.write)
+        ...
+        recorder.stop()
+
+    handle_video_event() takes the video events of tellopy, e.g. drone.subscribe(drone.EVENT_VIDEO_FRAME,
+    recorder.handle_video_event). The recording starts at the first key frame.
+
+    Needs PyAV (pip install av).
+    """
+
+    TIME_BASE = Fraction(1, 1000)  # timestamps in milliseconds
+    FRAME_RATE = 30  # nominal frame rate of Tello, the timestamps give the actual one
+
+    def __init__(self, path, format=None):
+        """
+        Arguments:
+            path: video file, its extension gives the container format
+            format: container format, e.g. 'matroska', to override the extension
+        """
+        if av is None:
+            raise ImportError('H264Recorder needs PyAV, install it with: pip install av')
+
+        self.path = path
+        self.format = format
+        self.parser = av.CodecContext.create('h264', 'r')
+        self.condition = threading.Condition()
+        self.chunks = deque()
+        self.container = None
+        self.stream = None
+        self.start_time = None
+        self.last_pts = -1
+        self.thread = None
+        self.stopped = True
+
+        # Statistics
+        self.received_bytes = 0
+        self.written_frames = 0
+        self.skipped_frames = 0
+        self.errors = 0
+
+    def start(self):
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def write(self, data):
+        """Queue a chunk of the H.264 stream, it can end in the middle of a frame. Doesn't block."""
+        self.chunks.append((time.monotonic(), data))
+        self.received_bytes += len(data)
+        with self.condition:
+            self.condition.notify()
+
+    def handle_video_event(self, event, sender, data, **args):
+        self.write(data)
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.chunks or self.stopped, 1.0)
+            if self.stopped and not self.chunks:
+                break
+
+            while self.chunks:
+                arrival, data = self.chunks.popleft()
+                try:
+                    for packet in self.parser.parse(data):
+                        self.mux(packet, arrival)
+                except Exception as e:
+                    self.errors += 1
+                    log.warning('H.264 recorder: %s', e)
+
+        # The parser holds the last frame until the next one starts
+        try:
+            for packet in self.parser.parse(None):
+                self.mux(packet, time.monotonic())
+        except Exception as e:
+            log.warning('H.264 recorder: %s', e)
+        if self.container is not None:
+            self.container.close()
+
+    def mux(self, packet, arrival):
+        if self.stream is None:
+            # The container needs the size of the frames, decode the first key frame to get it
+            if not packet.is_keyframe:
+                self.skipped_frames += 1
+                return
+            decoder = av.CodecContext.create('h264', 'r')
+            frames = decoder.decode(packet)
+            if not frames:
+                self.skipped_frames += 1
+                return
+            self.open(frames[0].width, frames[0].height)
+            self.start_time = arrival
+
+        # Timestamps must increase, even for frames parsed from the same chunk
+        pts = max(int((arrival - self.start_time) / self.TIME_BASE), self.last_pts + 1)
+        self.last_pts = pts
+        packet.stream = self.stream
+        packet.time_base = self.TIME_BASE
+        packet.pts = pts
+        packet.dts = pts
+        self.container.mux(packet)
+        self.written_frames += 1
+
+    def open(self, width, height):
+        self.container = av.open(self.path, 'w', format=self.format)
+        self.stream = self.container.add_stream('h264', rate=self.FRAME_RATE)
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.time_base = self.TIME_BASE
+        log.info('Recording %dx%d H.264 to %s', width, height, self.path)
+
+    def stop(self):
+        """Write the queued frames and close the file"""
+        self.stopped = True
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: received_bytes, written_frames, skipped_frames (before the first key frame) and errors
+        """
+        return {
+            'received_bytes': self.received_bytes,
+            'written_frames': self.written_frames,
+            'skipped_frames': self.skipped_frames,
+            'errors': self.errors,
+        }
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class CommandStats:
+    """Latency statistics of one kind of command. Commands are grouped by their first word, so 'forward 20' and
+    'forward 50' count as 'forward'.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        if self.min is None or latency < self.min:
+            self.min = latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+
+    def add_timeout(self):
+        self.timeouts += 1
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def __str__(self):
+        if self.count == 0:
+            return '%s: no responses, %d timeouts' % (self.name, self.timeouts)
+        return '%s: %d responses, %d timeouts, latency min %.1f ms, mean %.1f ms, max %.1f ms' % (
+            self.name, self.count, self.timeouts, self.min * 1000, self.mean * 1000, self.max * 1000)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class CommandScheduler:
+    """Outbound command queue of a Tello. Commands are queued by any thread and sent by a background thread one at a
+    time, as Tello only answers the last command it received. Every command gets a sequence number and a Future that
+    is resolved with its response, so callers can wait for it, ignore it (fire and forget) or await it from asyncio
+    with asyncio.wrap_future().
+
+    The next command is sent min_interval seconds after the previous response arrived, which is the minimum spacing
+    Tello needs to not drop commands.
+    """
+
+    def __init__(self, tello, min_interval):
+        self.tello = tello
+        self.min_interval = min_interval
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.stats = {}
+        self.last_response_time = 0
+        self.stopped = False
+
+        thread = threading.Thread(target=self.run, args=())
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, command, handler=None):
+        """Queue a command.
+        Arguments:
+            command: command string, e.g. 'forward 50'
+            handler: optional function(command, response) whose return value becomes the result of the Future
+
+        Returns:
+            Future: resolved with the response of Tello (False on timeout), or with the value of handler. The Future
+            also has the attributes sequence, command and, once resolved, latency (seconds) and response_time
+            (time.monotonic() of the response), both None on timeout.
+        """
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError('Command scheduler is stopped')
+            self.sequence += 1
+            future = Future()
+            future.sequence = self.sequence
+            future.command = command
+            future.latency = None
+            future.response_time = None
+            self.queue.put((future, handler))
+        return future
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            future, handler = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            wait = self.last_response_time + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                sent = time.monotonic()
+                response = self.tello.transmit_command(future.command)
+                self.last_response_time = time.monotonic()
+                stats = self.get_stats(future.command)
+                if response is False:
+                    stats.add_timeout()
+                else:
+                    future.latency = self.last_response_time - sent
+                    future.response_time = self.last_response_time
+                    stats.add(future.latency)
+
+                if handler is not None:
+                    response = handler(future.command, response)
+                future.set_result(response)
+            except Exception as e:
+                future.set_exception(e)
+
+    def get_stats(self, command):
+        name = command.split(' ')[0]
+        with self.lock:
+            if name not in self.stats:
+                self.stats[name] = CommandStats(name)
+            return self.stats[name]
+
+    def pending(self):
+        """Number of commands waiting in the queue"""
+        return self.queue.qsize()
+
+    def stop(self):
+        """Stop the background thread once the commands already queued have been sent"""
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.queue.put(None)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from collections import namedtuple
+
+# Fields of the state string sent by Tello, and how to convert their values
+STATE_FIELDS = {
+    'mid': int,
+    'x': int,
+    'y': int,
+    'z': int,
+    'pitch': int,
+    'roll': int,
+    'yaw': int,
+    'vgx': int,
+    'vgy': int,
+    'vgz': int,
+    'templ': int,
+    'temph': int,
+    'tof': int,
+    'h': int,
+    'bat': int,
+    'baro': float,
+    'time': int,
+    'agx': float,
+    'agy': float,
+    'agz': float,
+}
+
+log = logging.getLogger(__name__)
+
+
+class TelloState(namedtuple('TelloState', ['pitch', 'roll', 'yaw', 'vgx', 'vgy', 'vgz', 'templ', 'temph', 'tof',
+                                           'h', 'bat', 'baro', 'time', 'agx', 'agy', 'agz', 'received'])):
+    """Snapshot of the state of Tello, as sent by the drone on the state port:
+        pitch, roll, yaw: attitude (degrees)
+        vgx, vgy, vgz: speed (cm/s)
+        templ, temph: lowest and highest temperature (°C)
+        tof: distance from the TOF sensor (cm)
+        h: height (cm)
+        bat: battery percentage
+        baro: barometer measurement
+        time: motors on time (s)
+        agx, agy, agz: acceleration (0.001g)
+        received: time.monotonic() when the snapshot was received
+    Snapshots are immutable, a new one is created for every state packet. A field missing from a packet keeps its
+    previous value, it is None if the drone never sent it.
+    """
+    __slots__ = ()
+
+    def age(self):
+        """Seconds since the snapshot was received"""
+        return time.monotonic() - self.received
+
+
+def parse_state(data):
+    """Parse a state string like 'pitch:0;roll:0;yaw:0;...;\\r\\n' into a dict. The response of the attitude? command
+    has the same format. Unknown fields are kept as str.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('ascii', 'ignore')
+
+    values = {}
+    for field in data.strip().split(';'):
+        key, sep, value = field.partition(':')
+        if not sep:
+            continue
+        try:
+            values[key] = STATE_FIELDS.get(key, str)(value)
+        except ValueError:
+            values[key] = value
+    return values
+
+
+def make_state(data, previous=None):
+    """Create a TelloState from a state packet. Fields missing from a truncated or garbled packet keep their value in
+    the previous state of the drone, or are None.
+    Arguments:
+        data: state packet
+        previous: TelloState of the previous packet of the drone, None for the first one
+    """
+    values = parse_state(data)
+    for key in STATE_FIELDS:
+        if isinstance(values.get(key), str):
+            # Not a number, the packet is garbled
+            del values[key]
+    values['received'] = time.monotonic()
+    return TelloState(*[values.get(field, getattr(previous, field, None)) for field in TelloState._fields])
+
+
+def parse_temperature(response):
+    """Parse the response of the temp? command, e.g. '60~62C', into the average temperature"""
+    low, _, high = response.strip().rstrip('C').partition('~')
+    if not high:
+        high = low
+    return (int(low) + int(high)) / 2.0
+
+
+class StateReceiver:
+    """Listen to the state port of Tello on a background thread and keep the last state of every drone, by drone
+    address. All the drones send their state to the same port, so there is only one receiver per port, shared by the
+    Tello objects. Reading the state does not lock nor block: the receiver thread replaces the snapshot of a drone as
+    a whole.
+    """
+
+    receivers = {}
+    receivers_lock = threading.Lock()
+
+    @classmethod
+    def get_receiver(cls, port):
+        """Get the receiver of a port, starting it if needed"""
+        with cls.receivers_lock:
+            if port not in cls.receivers:
+                cls.receivers[port] = cls(port)
+            return cls.receivers[port]
+
+    def __init__(self, port):
+        self.port = port
+        self.states = {}
+        self.packets = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('', port))
+
+        thread = threading.Thread(target=self.run_udp_receiver, args=())
+        thread.daemon = True
+        thread.start()
+
+    def run_udp_receiver(self):
+        while True:
+            try:
+                data, (host, _) = self.socket.recvfrom(1024)
+            except Exception as e:
+                log.error('State receiver: %s', e)
+                break
+
+            self.states[host] = make_state(data, self.states.get(host))
+            self.packets += 1
+
+    def get_state(self, host):
+        """Get the last state received from a drone
+        Returns:
+            TelloState
+            None: no state received yet
+        """
+        return self.states.get(host)
+
+
+class StateProtocol(asyncio.DatagramProtocol):
+    """asyncio version of StateReceiver, used by AsyncTello. There is one per event loop and port."""
+
+    receivers = {}
+
+    @classmethod
+    async def get_receiver(cls, port):
+        """Get the receiver of a port, creating its endpoint if needed"""
+        loop = asyncio.get_event_loop()
+        key = (loop, port)
+        if key not in cls.receivers:
+            cls.receivers[key] = asyncio.ensure_future(
+                loop.create_datagram_endpoint(cls, local_addr=('0.0.0.0', port)))
+        _, receiver = await cls.receivers[key]
+        return receiver
+
+    def __init__(self):
+        self.states = {}
+        self.packets = 0
+
+    def datagram_received(self, data, addr):
+        self.states[addr[0]] = make_state(data, self.states.get(addr[0]))
+        self.packets += 1
+
+    def get_state(self, host):
+        """Get the last state received from a drone
+        Returns:
+            TelloState
+            None: no state received yet
+        """
+        return self.states.get(host)
@@ -0,0 +1,137 @@
+import threading
+import time
+
+from djitellopy.tello import Tello
+
+
+class BroadcastResult:
+    """Responses of every drone of a swarm to the same command, in the order of the drones"""
+
+    def __init__(self, command, futures, start):
+        self.command = command
+        self.responses = [future.result() for future in futures]
+        self.latencies = [future.latency for future in futures]
+        response_times = [future.response_time for future in futures]
+
+        # Seconds from the broadcast until the last drone acknowledged. None if any drone timed out
+        if None in response_times:
+            self.last_ack = None
+        else:
+            self.last_ack = max(response_times) - start
+
+    def all_ok(self):
+        return all(response is True or response in ('ok', 'OK') for response in self.responses)
+
+    def __str__(self):
+        if self.last_ack is None:
+            return '%s: %s, some drones did not answer' % (self.command, self.responses)
+        return '%s: %s, last acknowledge after %.1f ms' % (self.command, self.responses, self.last_ack * 1000)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TelloSwarm:
+    """Drive several Tello drones from one process. Every drone has its own address, local port, socket and command
+    queue, so a command broadcast to the swarm is sent to all the drones at the same time and the responses are
+    collected in parallel.
+
+        swarm = TelloSwarm(['192.168.1.11', '192.168.1.12'])
+        swarm.connect()
+        print(swarm.takeoff())
+        swarm.send_control_commands(['up 50', 'down 20'])
+        swarm.land()
+        swarm.end()
+
+    The drones must be in station mode (see Tello.set_wifi_with_ssid_password) so they join the same network.
+    """
+
+    def __init__(self, hosts, first_local_port=Tello.UDP_PORT):
+        """
+        Arguments:
+            hosts: IP addresses of the drones
+            first_local_port: local port of the first drone, the next ones use the following ports
+        """
+        self.tellos = [Tello(host, first_local_port + i) for i, host in enumerate(hosts)]
+
+    def __len__(self):
+        return len(self.tellos)
+
+    def __iter__(self):
+        return iter(self.tellos)
+
+    def __getitem__(self, index):
+        return self.tellos[index]
+
+    def broadcast(self, command):
+        """Send the same command to every drone at the same time and wait for all the responses.
+        Returns:
+            BroadcastResult: str responses, False for the drones that timed out
+        """
+        start = time.monotonic()
+        futures = [tello.send_command_async(command) for tello in self.tellos]
+        return BroadcastResult(command, futures, start)
+
+    def broadcast_control_command(self, command):
+        """Send the same control command to every drone at the same time and wait for all the responses.
+        Returns:
+            BroadcastResult: True for successful, False for unsuccessful
+        """
+        start = time.monotonic()
+        futures = [tello.send_control_command_async(command) for tello in self.tellos]
+        return BroadcastResult(command, futures, start)
+
+    def send_control_commands(self, commands):
+        """Send a different control command to each drone at the same time and wait for all the responses.
+        Arguments:
+            commands: one command per drone, None to skip a drone
+
+        Returns:
+            list: True for successful, False for unsuccessful, None for the skipped drones
+        """
+        if len(commands) != len(self.tellos):
+            raise ValueError('Expected %d commands, got %d' % (len(self.tellos), len(commands)))
+
+        futures = [tello.send_control_command_async(command) if command is not None else None
+                   for tello, command in zip(self.tellos, commands)]
+        return [future.result() if future is not None else None for future in futures]
+
+    def parallel(self, function):
+        """Call function(index, tello) for every drone, each one on its own thread, and wait for all of them. Use it
+        to run a sequence of commands per drone.
+        Returns:
+            list: return values of function, in the order of the drones
+        """
+        results = [None] * len(self.tellos)
+
+        def run(index, tello):
+            results[index] = function(index, tello)
+
+        threads = [threading.Thread(target=run, args=(i, tello)) for i, tello in enumerate(self.tellos)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def connect(self):
+        return self.broadcast_control_command('command')
+
+    def takeoff(self):
+        return self.broadcast_control_command('takeoff')
+
+    def land(self):
+        return self.broadcast_control_command('land')
+
+    def emergency(self):
+        return self.broadcast_control_command('emergency')
+
+    def send_rc_control(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Send the same RC control to every drone. See Tello.send_rc_control"""
+        for tello in self.tellos:
+            tello.send_rc_control(left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+
+    def end(self):
+        """Call this method when you want to end the swarm"""
+        for tello in self.tellos:
+            tello.end()
@@ -3,8 +3,16 @@ import socket
 import time
 import threading
 import cv2
+import logging
 from threading import Thread
 from djitellopy.decorators import accepts
+from djitellopy.frames import FramePool
+from djitellopy.mailbox import ResponseMailbox
+from djitellopy.scheduler import CommandScheduler
+from djitellopy.state import StateReceiver, parse_state, parse_temperature
+from djitellopy.video import H264FrameRead
+
+log = logging.getLogger(__name__)
 
 
 class Tello:
@@ -16,9 +24,12 @@ class Tello:
     UDP_IP = '192.168.10.1'
     UDP_PORT = 8889
     RESPONSE_TIMEOUT = 0.5  # in seconds
-    TIME_BTW_COMMANDS = 0.5  # in seconds
+    TIME_BTW_COMMANDS = 0.1  # in seconds, from the previous response to the next command
     TIME_BTW_RC_CONTROL_COMMANDS = 0.5  # in seconds
-    last_received_command = time.time()
+
+    # State stream, server socket
+    STATE_UDP_PORT = 8890
+    STATE_MAX_AGE = 0.5  # in seconds, older states are not used by the get_* methods
 
     # Video stream, server socket
     VS_UDP_IP = '0.0.0.0'
@@ -30,15 +41,29 @@ class Tello:
 
     stream_on = False
 
-    def __init__(self):
+    def __init__(self, host=UDP_IP, local_port=UDP_PORT):
+        """
+        Arguments:
+            host: IP address of the drone. Tello in station mode gets its address from the access point.
+            local_port: local port where the responses are received. Every Tello of the same host needs its own port.
+        """
         # To send comments
-        self.address = (self.UDP_IP, self.UDP_PORT)
+        self.address = (host, self.UDP_PORT)
+        self.local_port = local_port
         self.clientSocket = socket.socket(socket.AF_INET,  # Internet
                                           socket.SOCK_DGRAM)  # UDP
-        self.clientSocket.bind(('', self.UDP_PORT))  # For UDP response (receiving data)
-        self.response = None
+        self.clientSocket.bind(('', local_port))  # For UDP response (receiving data)
+        self.responses = ResponseMailbox()
         self.stream_on = False
         self.callbacks = []
+        self.scheduler = CommandScheduler(self, self.TIME_BTW_COMMANDS)
+
+        # Tello sends its state to STATE_UDP_PORT once in SDK mode. Without it, the get_* methods query the drone
+        try:
+            self.state_receiver = StateReceiver.get_receiver(self.STATE_UDP_PORT)
+        except socket.error as e:
+            log.warning('Could not listen to the state of Tello: %s', e)
+            self.state_receiver = None
 
         # Run tello udp receiver on background
         thread = threading.Thread(target=self.run_udp_receiver, args=())
@@ -50,9 +75,10 @@ class Tello:
         in order to not block the main thread."""
         while True:
             try:
-                self.response, _ = self.clientSocket.recvfrom(1024)  # buffer size is 1024 bytes
+                response, _ = self.clientSocket.recvfrom(1024)  # buffer size is 1024 bytes
+                self.responses.post(response)
             except Exception as e:
-                print(e)
+                log.error('UDP receiver: %s', e)
                 break
 
     def get_udp_video_address(self):
@@ -72,14 +98,21 @@ class Tello:
 
         return self.cap
 
-    def get_frame_read(self):
+    def get_frame_read(self, low_latency=False):
         """Get the BackgroundFrameRead object from the camera drone. Then, you just need to call
         backgroundFrameRead.frame to get the actual frame received by the drone.
+        Arguments:
+            low_latency: decode the H.264 stream directly with PyAV, always returning the newest frame. See
+                djitellopy.video.H264FrameRead
+
         Returns:
-            BackgroundFrameRead
+            BackgroundFrameRead or H264FrameRead
         """
         if self.background_frame_read is None:
-            self.background_frame_read = BackgroundFrameRead(self, self.get_udp_video_address()).start()
+            if low_latency:
+                self.background_frame_read = H264FrameRead(self.VS_UDP_IP, self.VS_UDP_PORT).start()
+            else:
+                self.background_frame_read = BackgroundFrameRead(self, self.get_udp_video_address()).start()
         return self.background_frame_read
 
     def stop_video_capture(self):
@@ -87,34 +120,52 @@ class Tello:
 
     @accepts(command=str)
     def send_command_with_return(self, command):
-        """Send command to Tello and wait for its response.
+        """Send command to Tello and wait for its response. The command goes through the command queue, so it is sent
+        once the previous commands have been answered and self.TIME_BTW_COMMANDS seconds have passed.
         Return:
-            bool: True for successful, False for unsuccessful
+            str: response of Tello
+            False: timeout
         """
-        # Commands very consecutive makes the drone not respond to them. So wait at least self.TIME_BTW_COMMANDS seconds
-        diff = time.time() * 1000 - self.last_received_command
-        if diff < self.TIME_BTW_COMMANDS:
-            time.sleep(diff)
-
-        print('Send command: ' + command)
-        timestamp = int(time.time() * 1000)
+        return self.scheduler.submit(command).result()
 
-        self.clientSocket.sendto(command.encode('utf-8'), self.address)
+    @accepts(command=str)
+    def send_command_async(self, command):
+        """Queue a command without waiting for its response. Ignore the returned Future to fire and forget, call
+        result() on it to wait, or await asyncio.wrap_future(future) from asyncio code.
+        Return:
+            Future: resolved with the response of Tello, False on timeout
+        """
+        return self.scheduler.submit(command)
 
-        while self.response is None:
-            if (time.time() * 1000) - timestamp > self.RESPONSE_TIMEOUT * 1000:
-                print('Timeout exceed on command ' + command)
-                return False
+    def transmit_command(self, command):
+        """Send command to Tello right away and wait for its response, bypassing the command queue. This is what the
+        command scheduler thread uses, call send_command_with_return instead.
+        Return:
+            str: response of Tello
+            False: timeout
+        """
+        log.info('Send command: %s', command)
 
-        print('Response: ' + str(self.response))
+        # Drop late responses of previous commands that timed out, so they are not taken as the response of this one
+        self.responses.clear()
+        self.clientSocket.sendto(command.encode('utf-8'), self.address)
 
-        response = self.response.decode('utf-8')
+        response = self.responses.get(timeout=self.RESPONSE_TIMEOUT)
+        if response is None:
+            log.warning('Timeout exceed on command %s', command)
+            return False
 
-        self.response = None
+        log.info('Response: %s', response)
 
-        self.last_received_command = time.time() * 1000
+        return response.decode('utf-8')
 
-        return response
+    def get_command_stats(self):
+        """Get the latency statistics of the commands sent so far
+        Returns:
+            dict: CommandStats by command name, e.g. 'forward'
+        """
+        with self.scheduler.lock:
+            return dict(self.scheduler.stats)
 
     @accepts(command=str)
     def send_command_without_return(self, command):
@@ -138,9 +189,7 @@ class Tello:
                 c: up/down (-100~100)
                 d: yaw (-100~100)
         """
-        # Commands very consecutive makes the drone not respond to them. So wait at least self.TIME_BTW_COMMANDS seconds
-
-        print('Send command (no expect response): ' + command)
+        log.debug('Send command (no expect response): %s', command)
         self.clientSocket.sendto(command.encode('utf-8'), self.address)
 
     @accepts(command=str)
@@ -172,8 +221,18 @@ class Tello:
             bool: True for successful, False for unsuccessful
         """
 
-        response = self.send_command_with_return(command)
+        return self.send_control_command_async(command).result()
+
+    @accepts(command=str)
+    def send_control_command_async(self, command):
+        """Queue a control command without waiting for its response. See send_control_command.
+        Return:
+            Future: resolved with True for successful, False for unsuccessful
+        """
+        return self.scheduler.submit(command, self.control_command_result)
 
+    def control_command_result(self, command, response):
+        """Turn the response of a control command into True or False"""
         if response == 'OK' or response == 'ok':
             return True
         else:
@@ -196,12 +255,14 @@ class Tello:
             bool: True for successful, False for unsuccessful
         """
 
-        response = self.send_command_with_return(command)
+        return self.scheduler.submit(command, self.read_command_result).result()
 
+    def read_command_result(self, command, response):
+        """Turn the response of a read command into an int, a str, or False if unsuccessful"""
         try:
             response = str(response)
         except TypeError as e:
-            print(e)
+            log.error('%s', e)
             pass
 
         if ('error' not in response) and ('ERROR' not in response) and ('False' not in response):
@@ -229,8 +290,8 @@ class Tello:
 
     @staticmethod
     def return_error_on_send_command(command, response):
-        """Returns False and print an informative result code to show unsuccessful response"""
-        print('Command ' + command + ' was unsuccessful. Message: ' + str(response))
+        """Returns False and log an informative result code to show unsuccessful response"""
+        log.warning('Command %s was unsuccessful. Message: %s', command, response)
         return False
 
     def connect(self):
@@ -495,6 +556,18 @@ class Tello:
             return self.send_command_without_return('rc %s %s %s %s' % (left_right_velocity, forward_backward_velocity,
                                                                         up_down_velocity, yaw_velocity))
 
+    def send_rc_command(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Send RC control via four channels right away, without rate limit nor print. Meant to be called at a fixed
+        rate, see djitellopy.control.RCControlLoop.
+        Arguments:
+            left_right_velocity: -100~100 (left/right)
+            forward_backward_velocity: -100~100 (forward/backward)
+            up_down_velocity: -100~100 (up/down)
+            yaw_velocity: -100~100 (yaw)
+        """
+        command = 'rc %s %s %s %s' % (left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+        self.clientSocket.sendto(command.encode('utf-8'), self.address)
+
     def set_wifi_with_ssid_password(self):
         """Set Wi-Fi with SSID password.
         Returns:
@@ -510,13 +583,58 @@ class Tello:
         """
         return self.send_read_command('speed?')
 
+    def get_state(self):
+        """Get the last state received from Tello, without sending any command
+        Returns:
+            TelloState: see djitellopy.state.TelloState
+            None: no state received in the last self.STATE_MAX_AGE seconds
+        """
+        if self.state_receiver is None:
+            return None
+        state = self.state_receiver.get_state(self.address[0])
+        if state is None or state.age() > self.STATE_MAX_AGE:
+            return None
+        return state
+
+    def read_state(self, get_value, command, parse_response=None):
+        """Read a value from the last state received from Tello. If there is no recent state, or the drone never sent
+        the fields of the value, query it with a read command and convert the response with parse_response.
+        """
+        value = self.state_value(self.get_state(), get_value)
+        if value is not None:
+            return value
+        return self.parse_read_response(self.send_read_command(command), parse_response)
+
+    @staticmethod
+    def state_value(state, get_value):
+        """Get a value from a state, None if there is no state or a field of the value is missing (None)"""
+        if state is None:
+            return None
+        try:
+            value = get_value(state)
+        except TypeError:
+            # Arithmetic on a missing field
+            return None
+        if isinstance(value, dict) and None in value.values():
+            return None
+        return value
+
+    @staticmethod
+    def parse_read_response(response, parse_response):
+        if parse_response is None or response is False:
+            return response
+        try:
+            return parse_response(response)
+        except ValueError:
+            return response
+
     def get_battery(self):
         """Get current battery percentage
         Returns:
             False: Unsuccessful
-            int: -100
+            int: 0-100
         """
-        return self.send_read_command('battery?')
+        return self.read_state(lambda state: state.bat, 'battery?')
 
     def get_flight_time(self):
         """Get current fly time (s)
@@ -524,7 +642,7 @@ class Tello:
             False: Unsuccessful
             int: Seconds elapsed during flight.
         """
-        return self.send_read_command('time?')
+        return self.read_state(lambda state: state.time, 'time?')
 
     def get_height(self):
         """Get height (cm)
@@ -532,31 +650,32 @@ class Tello:
             False: Unsuccessful
             int: 0-3000
         """
-        return self.send_read_command('height?')
+        return self.read_state(lambda state: state.h, 'height?')
 
     def get_temperature(self):
-        """Get temperature (°C)
+        """Get temperature (°C), average of the lowest and highest temperatures
         Returns:
             False: Unsuccessful
-            int: 0-90
+            float: 0-90
         """
-        return self.send_read_command('temperature?')
+        return self.read_state(lambda state: (state.templ + state.temph) / 2.0, 'temp?', parse_temperature)
 
     def get_attitude(self):
         """Get IMU attitude data
         Returns:
             False: Unsuccessful
-            int: pitch roll yaw
+            dict: pitch, roll and yaw (degrees)
         """
-        return self.send_read_command('attitude?')
+        return self.read_state(lambda state: {'pitch': state.pitch, 'roll': state.roll, 'yaw': state.yaw},
+                               'attitude?', parse_state)
 
     def get_barometer(self):
         """Get barometer value (m)
         Returns:
             False: Unsuccessful
-            int: 0-100
+            float: 0-100
         """
-        return self.send_read_command('baro?')
+        return self.read_state(lambda state: state.baro, 'baro?', float)
 
     def get_distance_tof(self):
         """Get distance value from TOF (cm)
@@ -564,7 +683,7 @@ class Tello:
             False: Unsuccessful
             int: 30-1000
         """
-        return self.send_read_command('tof?')
+        return self.read_state(lambda state: state.tof, 'tof?')
 
     def get_wifi(self):
         """Get Wi-Fi SNR
@@ -582,14 +701,18 @@ class Tello:
             self.background_frame_read.stop()
         if self.cap is not None:
             self.cap.release()
+        self.scheduler.stop()
 
 
 class BackgroundFrameRead:
     """
     This class read frames from a VideoCapture in background. Then, just call backgroundFrameRead.frame to get the
-    actual one.
+    actual one, as a copy. Frames are decoded into the preallocated arrays of a FramePool:
+    backgroundFrameRead.borrow_frame() gives the pooled frame itself, without a copy, until it is released.
     """
 
+    POOL_SIZE = 8
+
     def __init__(self, tello, address):
         tello.cap = cv2.VideoCapture(address)
         self.cap = tello.cap
@@ -598,19 +721,83 @@ class BackgroundFrameRead:
         if not self.cap.isOpened():
             self.cap.open(address)
 
-        self.grabbed, self.frame = self.cap.read()
+        self.pool = None
+        self.scratch = None
+        self.dropped_frames = 0
+
+        self.grabbed, frame = self.cap.read()
+        if self.grabbed:
+            self.publish_copy(frame)
         self.stopped = False
 
     def start(self):
         Thread(target=self.update_frame, args=()).start()
         return self
 
+    @property
+    def frame(self):
+        """Copy of the newest frame, owned by the caller. Use borrow_frame() to read the frame without a copy."""
+        pooled = self.borrow_frame()
+        if pooled is None:
+            return None
+        with pooled as array:
+            return array.copy()
+
+    def borrow_frame(self):
+        """Get the newest frame and keep it from being reused. Call release() on it once done, or use it in a with
+        statement.
+        Returns:
+            PooledFrame
+            None: no frame received yet
+        """
+        if self.pool is None:
+            return None
+        return self.pool.borrow_latest()
+
+    def wait_frame(self, after=0, timeout=1.0):
+        """Wait for a frame newer than the frame number after, and keep it from being reused. Call release() on it
+        once done.
+        Returns:
+            PooledFrame: its number attribute is the number of the frame
+            None: timeout expired
+        """
+        if self.pool is None:
+            # Nothing decoded yet
+            time.sleep(min(timeout, 0.1))
+            return None
+        return self.pool.wait_newer(after, timeout)
+
+    def publish_copy(self, image):
+        """Copy a frame that was not decoded into the pool, creating the pool if the frame size changed"""
+        if self.pool is None or self.pool.shape != image.shape:
+            self.pool = FramePool(image.shape, image.dtype, self.POOL_SIZE)
+        pooled = self.pool.get_free()
+        if pooled is None:
+            self.dropped_frames += 1
+            return
+        pooled.array[...] = image
+        self.pool.publish(pooled)
+
     def update_frame(self):
         while not self.stopped:
             if not self.grabbed or not self.cap.isOpened():
                 self.stop()
+                continue
+
+            pooled = self.pool.get_free()
+            if pooled is None:
+                # Every frame is held by consumers. Keep up with the stream and drop this one
+                self.grabbed, self.scratch = self.cap.read(self.scratch)
+                self.dropped_frames += 1
+                continue
+
+            self.grabbed, image = self.cap.read(pooled.array)
+            if self.grabbed and image is pooled.array:
+                self.pool.publish(pooled)
             else:
-                (self.grabbed, self.frame) = self.cap.read()
+                pooled.release()
+                if self.grabbed:
+                    self.publish_copy(image)
 
     def stop(self):
         self.stopped = True
@@ -0,0 +1,160 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    x1 = max(a[0], b[0])
+    y1 = max(a[1], b[1])
+    x2 = min(a[0] + a[2], b[0] + b[2])
+    y2 = min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def center_distance(a, b):
+    """Distance between the centers of two (x, y, w, h) boxes"""
+    return ((a[0] + a[2] / 2.0 - b[0] - b[2] / 2.0) ** 2 + (a[1] + a[3] / 2.0 - b[1] - b[3] / 2.0) ** 2) ** 0.5
+
+
+class Track:
+    """One tracked object. A constant velocity Kalman filter on the center and the size of its box predicts where
+    it is on every frame, and smooths the boxes given by the detector.
+    """
+
+    def __init__(self, track_id, class_id, confidence, box):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.confidence = confidence
+        self.hits = 1
+        self.misses = 0
+
+        # State (center x, center y, w, h) and their speeds in pixels per frame
+        self.kalman = cv2.KalmanFilter(8, 4)
+        self.kalman.transitionMatrix = np.eye(8, dtype=np.float32)
+        self.kalman.transitionMatrix[:4, 4:] = np.eye(4, dtype=np.float32)
+        self.kalman.measurementMatrix = np.eye(4, 8, dtype=np.float32)
+        self.kalman.processNoiseCov = np.diag(np.array([1, 1, 1, 1, 0.1, 0.1, 0.1, 0.1], np.float32))
+        self.kalman.measurementNoiseCov = np.eye(4, dtype=np.float32) * 10
+        self.kalman.errorCovPost = np.diag(np.array([10, 10, 10, 10, 100, 100, 100, 100], np.float32))
+        self.kalman.statePost = np.zeros((8, 1), np.float32)
+        self.kalman.statePost[:4, 0] = self.to_measurement(box)
+        self.measurement = np.empty((4, 1), np.float32)
+
+    @staticmethod
+    def to_measurement(box):
+        x, y, w, h = box
+        return x + w / 2.0, y + h / 2.0, w, h
+
+    @property
+    def box(self):
+        """Current (x, y, w, h) box"""
+        cx, cy, w, h = self.kalman.statePost[:4, 0]
+        return float(cx - w / 2.0), float(cy - h / 2.0), float(w), float(h)
+
+    def predict(self):
+        """Move the box one frame forward"""
+        # Without a measurement, OpenCV also makes the prediction the corrected state
+        self.kalman.predict()
+
+    def correct(self, class_id, confidence, box):
+        """Update the box with a detection of the object"""
+        self.measurement[:, 0] = self.to_measurement(box)
+        self.kalman.correct(self.measurement)
+        self.class_id = class_id
+        self.confidence = confidence
+        self.hits += 1
+        self.misses = 0
+
+
+class ObjectTracker:
+    """Follow the detected objects between two runs of the detector, so every frame gets boxes.
+
+    update() associates the detections with the tracks by IoU of their boxes, greedily from the best overlap. As the
+    detector runs rarely, fast objects may not overlap their track anymore: detections that don't overlap are still
+    associated with the nearest track whose center is less than distance_threshold box sizes away.
+    predict() is called once per frame and moves every track by its estimated speed. A track is deleted when the
+    detector missed it max_misses times in a row. Thread safe, the detector and the display can run in different
+    threads.
+    """
+
+    def __init__(self, iou_threshold=0.3, distance_threshold=1.0, max_misses=2):
+        """
+        Arguments:
+            iou_threshold: minimum IoU between a track and a detection of the same class to associate them
+            distance_threshold: maximum distance between the centers of a track and a detection that don't overlap
+                enough to associate them, relative to the biggest side of the box of the track
+            max_misses: number of detector runs without the object after which its track is deleted
+        """
+        self.iou_threshold = iou_threshold
+        self.distance_threshold = distance_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def update(self, detections):
+        """Associate new detections with the tracks.
+        Arguments:
+            detections: list of (class_id, confidence, x, y, w, h), e.g. from detect_objects()
+        """
+        with self.lock:
+            pairs = []
+            for t, track in enumerate(self.tracks):
+                box = track.box
+                for d, detection in enumerate(detections):
+                    if detection[0] != track.class_id:
+                        continue
+                    # Overlapping pairs score in [1, 2], the others in [0, 1] from their distance
+                    overlap = iou(box, detection[2:])
+                    if overlap >= self.iou_threshold:
+                        pairs.append((1.0 + overlap, t, d))
+                        continue
+                    limit = self.distance_threshold * max(box[2], box[3])
+                    distance = center_distance(box, detection[2:])
+                    if distance < limit:
+                        pairs.append((1.0 - distance / limit, t, d))
+            pairs.sort(reverse=True)
+
+            matched_tracks = set()
+            matched_detections = set()
+            for score, t, d in pairs:
+                if t in matched_tracks or d in matched_detections:
+                    continue
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                detection = detections[d]
+                self.tracks[t].correct(detection[0], detection[1], detection[2:])
+
+            tracks = []
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks:
+                    track.misses += 1
+                    if track.misses > self.max_misses:
+                        continue
+                tracks.append(track)
+
+            for d, detection in enumerate(detections):
+                if d not in matched_detections:
+                    tracks.append(Track(self.next_id, detection[0], detection[1], detection[2:]))
+                    self.next_id += 1
+
+            self.tracks = tracks
+
+    def predict(self):
+        """Move the tracks one frame forward.
+        Returns:
+            list: (track_id, class_id, confidence, x, y, w, h) of every track
+        """
+        with self.lock:
+            result = []
+            for track in self.tracks:
+                track.predict()
+                result.append((track.track_id, track.class_id, track.confidence) + track.box)
+            return result
+
+    def __len__(self):
+        return len(self.tracks)
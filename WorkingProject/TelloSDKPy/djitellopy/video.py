@@ -0,0 +1,220 @@
+import logging
+import socket
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from djitellopy.frames import FramePool
+
+try:
+    import av
+except ImportError:
+    av = None
+
+log = logging.getLogger(__name__)
+
+
+def low_latency_available():
+    """Tell if PyAV is installed, H264FrameRead and H264Recorder need it"""
+    return av is not None
+
+
+def plane_view(plane, width, height):
+    """View of the pixels of a PyAV video plane without its row padding"""
+    return np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)[:height, :width]
+
+
+class H264FrameRead:
+    """
+    Low latency alternative to BackgroundFrameRead. This class receives the H.264 stream of Tello directly from the
+    video port and decodes it on a worker thread, without the buffering of cv2.VideoCapture. Only the newest decoded
+    frame is kept: frames that were not read before the next one is decoded are dropped. Then, just call
+    h264FrameRead.frame to get a copy of the actual one. Frames are converted into the preallocated arrays of a
+    FramePool: h264FrameRead.borrow_frame() gives the pooled frame itself, without a copy, until it is released.
+
+    Sinks added with add_sink() get the raw H.264 stream as it is received, e.g. H264Recorder.write to record it
+    without re-encoding.
+
+    Needs PyAV (pip install av).
+    """
+
+    RECEIVE_BUFFER_SIZE = 512 * 1024  # in bytes, socket buffer
+    POOL_SIZE = 8
+
+    def __init__(self, address, port):
+        if av is None:
+            raise ImportError('H264FrameRead needs PyAV, install it with: pip install av')
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECEIVE_BUFFER_SIZE)
+        self.socket.bind((address, port))
+        self.socket.settimeout(1.0)
+
+        self.codec = av.CodecContext.create('h264', 'r')
+        self.condition = threading.Condition()
+        self.chunks = deque()
+        self.sinks = ()
+
+        self.pool = None
+        self.yuv = None  # planes of the frame being converted, in I420 layout
+        self.frame_read = True
+        self.grabbed = False
+        self.stopped = False
+
+        # Statistics
+        self.received_bytes = 0
+        self.decoded_frames = 0
+        self.dropped_frames = 0
+        self.decode_errors = 0
+
+    def start(self):
+        for target in (self.run_udp_receiver, self.run_decoder):
+            thread = threading.Thread(target=target, args=())
+            thread.daemon = True
+            thread.start()
+        return self
+
+    @property
+    def frame(self):
+        """Copy of the newest decoded frame, BGR numpy array owned by the caller. None until the first frame is decoded.
+        Use borrow_frame() to read the frame without a copy."""
+        pooled = self.borrow_frame()
+        if pooled is None:
+            return None
+        with pooled as array:
+            return array.copy()
+
+    def borrow_frame(self):
+        """Get the newest frame and keep it from being reused. Call release() on it once done, or use it in a with
+        statement.
+        Returns:
+            PooledFrame
+            None: no frame decoded yet
+        """
+        self.frame_read = True
+        if self.pool is None:
+            return None
+        return self.pool.borrow_latest()
+
+    def wait_frame(self, after=0, timeout=1.0):
+        """Wait for a frame newer than the frame number after, and keep it from being reused. Call release() on it
+        once done.
+        Returns:
+            PooledFrame: its number attribute is the number of the frame
+            None: timeout expired
+        """
+        if self.pool is None:
+            # Nothing decoded yet
+            time.sleep(min(timeout, 0.1))
+            return None
+        pooled = self.pool.wait_newer(after, timeout)
+        if pooled is not None:
+            self.frame_read = True
+        return pooled
+
+    def add_sink(self, sink):
+        """Call sink(data) with every chunk of the H.264 stream, from the receiver thread. The sink must not block."""
+        # Replace the tuple, so the receiver thread iterates over it without a lock
+        self.sinks = self.sinks + (sink,)
+
+    def remove_sink(self, sink):
+        self.sinks = tuple(s for s in self.sinks if s != sink)
+
+    def run_udp_receiver(self):
+        while not self.stopped:
+            try:
+                data = self.socket.recv(2048)
+            except socket.timeout:
+                continue
+            except Exception as e:
+                log.error('H.264 decoder: %s', e)
+                self.stop()
+                break
+
+            for sink in self.sinks:
+                sink(data)
+
+            with self.condition:
+                self.chunks.append(data)
+                self.received_bytes += len(data)
+                self.condition.notify()
+
+        self.socket.close()
+
+    def run_decoder(self):
+        while not self.stopped:
+            # Take everything received so far, so a slow decode does not make the stream fall behind
+            with self.condition:
+                self.condition.wait_for(lambda: self.chunks or self.stopped, 1.0)
+                data = b''.join(self.chunks)
+                self.chunks.clear()
+
+            if not data:
+                continue
+
+            frames = []
+            try:
+                for packet in self.codec.parse(data):
+                    frames.extend(self.codec.decode(packet))
+            except Exception:
+                self.decode_errors += 1
+                continue
+
+            if not frames:
+                continue
+
+            # Only the last frame is converted to BGR, the previous ones would be replaced right away
+            self.decoded_frames += len(frames)
+            self.dropped_frames += len(frames) - 1
+            self.publish(frames[-1])
+
+    def publish(self, frame):
+        """Convert a decoded frame to BGR straight into a free frame of the pool"""
+        shape = (frame.height, frame.width, 3)
+        if self.pool is None or self.pool.shape != shape:
+            self.pool = FramePool(shape, np.uint8, self.POOL_SIZE)
+            self.yuv = np.empty((frame.height * 3 // 2, frame.width), np.uint8)
+        pooled = self.pool.get_free()
+        if pooled is None:
+            # Every frame is held by consumers
+            self.dropped_frames += 1
+            return
+
+        if frame.format.name == 'yuv420p' and frame.height % 4 == 0 and frame.width % 2 == 0:
+            # Gather the planes without their row padding, then OpenCV writes the BGR pixels into the pooled array
+            height, width = frame.height, frame.width
+            u = self.yuv[height:height + height // 4].reshape(height // 2, width // 2)
+            v = self.yuv[height + height // 4:].reshape(height // 2, width // 2)
+            np.copyto(self.yuv[:height], plane_view(frame.planes[0], width, height))
+            np.copyto(u, plane_view(frame.planes[1], width // 2, height // 2))
+            np.copyto(v, plane_view(frame.planes[2], width // 2, height // 2))
+            cv2.cvtColor(self.yuv, cv2.COLOR_YUV2BGR_I420, dst=pooled.array)
+        else:
+            # Other pixel formats, e.g. full range yuvj420p, go through a converted frame
+            np.copyto(pooled.array, frame.to_ndarray(format='bgr24'))
+
+        if not self.frame_read:
+            self.dropped_frames += 1
+        self.pool.publish(pooled)
+        self.frame_read = False
+        self.grabbed = True
+
+    def get_stats(self):
+        """Get the counters of the stream
+        Returns:
+            dict: received_bytes, decoded_frames, dropped_frames and decode_errors
+        """
+        return {
+            'received_bytes': self.received_bytes,
+            'decoded_frames': self.decoded_frames,
+            'dropped_frames': self.dropped_frames,
+            'decode_errors': self.decode_errors,
+        }
+
+    def stop(self):
+        self.stopped = True
+        with self.condition:
+            self.condition.notify_all()
@@ -0,0 +1,270 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+log = logging.getLogger(__name__)
+
+
+def worker_error(e):
+    """Exception of a worker process that can be sent back through a queue, whatever the type of e"""
+    return RuntimeError('Detector worker: %s: %s' % (type(e).__name__, e))
+
+
+def detector_worker(weights, config, memory_name, shape, slots, tasks, results, threads):
+    """Main function of a ProcessDetector worker process"""
+    import cv2
+    from djitellopy.model import DetectorModel
+
+    if threads is not None:
+        cv2.setNumThreads(threads)
+    memory = shared_memory.SharedMemory(name=memory_name)
+    frames = np.ndarray((slots,) + tuple(shape), np.uint8, memory.buf)
+    try:
+        try:
+            model = DetectorModel(weights, config)
+        except Exception as e:
+            results.put((None, None, worker_error(e)))
+            return
+        results.put((None, None, str(model)))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job, slot, conf_threshold, nms_threshold = task
+            try:
+                detections = model.detect(frames[slot], conf_threshold, nms_threshold)
+            except Exception as e:
+                # The slot and the Future of the job are released by the result, even on error
+                results.put((job, slot, worker_error(e)))
+                continue
+            results.put((job, slot, np.array(detections, np.float32).reshape(-1, 6)))
+    finally:
+        del frames
+        memory.close()
+
+
+class ProcessDetector:
+    """Run a DetectorModel in worker processes, so long forward passes and their post processing don't hold the GIL
+    of the process that decodes the video and sends the RC commands.
+
+    Frames are copied into slots of a shared memory block (multiprocessing.shared_memory) instead of being pickled,
+    and the detections come back as small (N, 6) float32 arrays. submit() has the same interface as
+    BatchDetector.submit(): it returns a Future resolved with the list of (class_id, confidence, x, y, w, h) of the
+    detections, with the attributes batch_size and latency.
+
+    The worker processes are started with the spawn method, so the main script must be guarded by
+    if __name__ == '__main__'. Needs Python 3.8 or later.
+    """
+
+    def __init__(self, weights, config, shape=(720, 960, 3), workers=1, slots=None, threads=None,
+                 conf_threshold=0.5, nms_threshold=0.4):
+        """
+        Arguments:
+            weights: path of the weights file
+            config: path of the config file
+            shape: shape of the frames
+            workers: number of worker processes, each loads its own copy of the model
+            slots: number of frames that can be waiting or processed at the same time, 2 per worker by default
+            threads: number of OpenCV threads per worker, None to keep the OpenCV default
+        """
+        if shared_memory is None:
+            raise ImportError('ProcessDetector needs multiprocessing.shared_memory (Python 3.8 or later)')
+
+        self.weights = weights
+        self.config = config
+        self.shape = tuple(shape)
+        self.workers = workers
+        self.slots = slots or 2 * workers
+        self.threads = threads
+        self.conf_threshold = conf_threshold
+        self.nms_threshold = nms_threshold
+
+        self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * self.slots)
+        self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, self.memory.buf)
+        self.free_slots = queue.Queue()
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+
+        context = multiprocessing.get_context('spawn')
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = []
+        self.futures = {}
+        self.next_job = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.error = None
+        self.stopped = True
+
+        # Statistics
+        self.frames_detected = 0
+        self.frames_dropped = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+        for _ in range(workers):
+            process = context.Process(target=detector_worker, args=(
+                weights, config, self.memory.name, self.shape, self.slots, self.tasks, self.results, threads))
+            process.daemon = True
+            self.processes.append(process)
+
+    def start(self, timeout=60):
+        """Start the workers and wait until they loaded and warmed up their model.
+        Raises RuntimeError if a worker fails to load the model, or doesn't load it within timeout seconds.
+        Returns:
+            ProcessDetector
+        """
+        for process in self.processes:
+            process.start()
+        for _ in self.processes:
+            try:
+                job, slot, description = self.results.get(timeout=timeout)
+            except queue.Empty:
+                description = RuntimeError('Detector worker: model not loaded after %d s' % timeout)
+            if isinstance(description, Exception):
+                self.stop()
+                raise description
+            log.info('%s', description)
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self.collect_results, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def submit(self, frame, timeout=None):
+        """Copy a BGR frame into shared memory and queue it for detection.
+        Arguments:
+            frame: numpy array with the shape given to the constructor, it can be reused as soon as submit returns
+            timeout: seconds to wait for a free slot, None to wait forever
+
+        Returns:
+            Future: resolved with the list of (class_id, confidence, x, y, w, h) of the detections
+            None: no free slot before the timeout, the frame is dropped
+        Raises RuntimeError once a worker died, or if the detector is not running.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.stopped:
+            raise RuntimeError('ProcessDetector is not running')
+        if frame.shape != self.shape:
+            raise ValueError('Frame shape ' + str(frame.shape) + ' is not ' + str(self.shape))
+
+        try:
+            slot = self.free_slots.get(timeout=timeout)
+        except queue.Empty:
+            with self.lock:
+                self.frames_dropped += 1
+            return None
+        self.frames[slot] = frame
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        future.batch_size = 1
+        future.start = time.monotonic()
+        future.slot = slot
+        with self.lock:
+            job = self.next_job
+            self.next_job += 1
+            self.futures[job] = future
+        self.tasks.put((job, slot, self.conf_threshold, self.nms_threshold))
+        return future
+
+    def collect_results(self):
+        while not self.stopped:
+            try:
+                job, slot, detections = self.results.get(timeout=0.5)
+            except queue.Empty:
+                self.check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                future = self.futures.pop(job, None)
+                if future is None:
+                    # Already failed, its slot was released then
+                    continue
+                future.latency = time.monotonic() - future.start
+                if isinstance(detections, Exception):
+                    self.errors += 1
+                else:
+                    self.frames_detected += 1
+                    self.busy_time += future.latency
+            self.free_slots.put(slot)
+
+            if isinstance(detections, Exception):
+                future.set_exception(detections)
+                continue
+            future.set_result([(int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]),
+                                float(row[5])) for row in detections])
+
+    def check_workers(self):
+        """Fail the pending jobs and the next submits once a worker process died, it may have taken a job along"""
+        if self.error is not None or self.stopped:
+            return
+        dead = [process for process in self.processes if not process.is_alive()]
+        if dead:
+            self.error = RuntimeError('Detector worker died (exit code %s)' % dead[0].exitcode)
+            log.error('%s', self.error)
+            self.fail_pending(self.error)
+
+    def fail_pending(self, error):
+        """Resolve the pending futures, with error if not None, and release their slots"""
+        with self.lock:
+            futures = list(self.futures.values())
+            self.futures.clear()
+        for future in futures:
+            future.latency = None
+            self.free_slots.put(future.slot)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result([])
+
+    def stop(self, timeout=2.0):
+        """Stop the workers and free the shared memory. The pending futures get an error if a worker died, an empty
+        result otherwise."""
+        self.stopped = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            if not process.is_alive() and self.error is None and process.exitcode not in (None, 0):
+                self.error = RuntimeError('Detector worker died (exit code %s)' % process.exitcode)
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.fail_pending(self.error)
+
+        del self.frames
+        self.memory.close()
+        self.memory.unlink()
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: frames detected, frames dropped for lack of a free slot, detection errors and mean latency (s) from
+                submit to result
+        """
+        with self.lock:
+            return {
+                'frames': self.frames_detected,
+                'dropped': self.frames_dropped,
+                'errors': self.errors,
+                'latency': self.busy_time / self.frames_detected if self.frames_detected else None,
+            }
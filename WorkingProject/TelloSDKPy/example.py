@@ -1,34 +1,28 @@
 import time
 import traceback
 import sys
-from subprocess import Popen, PIPE
 
 import cv2 as cv
 import numpy as np
 import pygame
 from djitellopy import Tello
+from djitellopy.control import RCControlLoop
+from djitellopy.display import FrameDisplay
+from djitellopy.log import start_logging
+from djitellopy.recorder import H264Recorder
+from djitellopy.video import low_latency_available
 from pygame.locals import *
 
 # Speed of the drone
 S = 60
 # Frames per second of the pygame window display
 FPS = 25
-# video_output = None
+# RC commands sent per second
+RC_RATE = 20
+# The H.264 stream of the drone is written as it is received, without re-encoding (needs PyAV). None to disable
+RECORD_FILE = "myvideo.mkv"
 
 
-
-#
-# def videoFrameHandler(event, sender, data):
-#     global video_output
-#     if video_output is None:
-#         cmd = ['ffmpeg', '-i', 'pipe', 'tristan.mp4']
-#         video_output = Popen(cmd, stdin=PIPE)
-#
-#     try:
-#         video_output.stdin.write(data)
-#     except IOError as err:
-#         video_output = None
-
 class FrontEnd(object):
     """ Maintains the Tello display and moves it through the keyboard keys.
         Press escape key to quit.
@@ -46,12 +40,12 @@ class FrontEnd(object):
         # Init pygame
         self.cv = cv.cv2
         pygame.init()
-        # videoFrameHandler()
 
         # Creat pygame window
 
         pygame.display.set_caption("Tello video stream")
         self.screen = pygame.display.set_mode([960, 720])
+        self.display = FrameDisplay(self.screen, FPS)
 
         # Init Tello object that interacts with the Tello drone
         self.tello = Tello()
@@ -67,8 +61,8 @@ class FrontEnd(object):
 
         self.send_rc_control = False
 
-        # create update timer
-        pygame.time.set_timer(USEREVENT + 1, 50)
+        # Sends the velocities to Tello at a fixed rate, whatever the event loop is doing
+        self.control = RCControlLoop(self.tello, RC_RATE)
 
 
 
@@ -91,16 +85,20 @@ class FrontEnd(object):
             print("Could not start video stream")
             return
         print("trying to recieve tello video to pygame")
-        # frame_read = self.tello.get_frame_read()
-        # print("got this tello frame and put it into pygame")
+        self.display.start()
+        self.control.start()
+        # The low latency reader needs PyAV, it gives access to the raw stream for the recorder
+        frame_read = self.tello.get_frame_read(low_latency=RECORD_FILE is not None or low_latency_available())
+        recorder = None
+        if RECORD_FILE is not None:
+            recorder = H264Recorder(RECORD_FILE).start()
+            frame_read.add_sink(recorder.write)
 
         should_stop = False
         while not should_stop:
 
             for event in pygame.event.get():
-                if event.type == USEREVENT + 1:
-                    self.update()
-                elif event.type == QUIT:
+                if event.type == QUIT:
                     should_stop = True
                 elif event.type == KEYDOWN:
                     if event.key == K_ESCAPE:
@@ -114,51 +112,29 @@ class FrontEnd(object):
             #     frame_read.stop()
             #     break
 
-            self.screen.fill([0, 0, 0])
             # frame = cv.cvtColor(frame_read.frame, cv.COLOR_BGR2RGB)
             # frame = np.rot90(frame)
             # frame = pygame.surfarray.make_surface(frame)
 
 
 
-            cap = self.tello.get_video_capture()
-            # define the codec and create VideoWriter object
-            fourcc = cv.VideoWriter_fourcc(*'X264')
-            out = cv.VideoWriter('myvideo.mp4', fourcc, 20.0, (640,480))
-            codec = cv.CAP_PROP_FOURCC
-            print(codec)
-            while cap.isOpened():
-                print("is opened")
-                ret, frame = cap.read()
-                if ret:
-                    print("is ret")
-                    frame = cv.flip(frame,90)
-                    frame = np.rot90(frame)
-                    frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-
-                    frame = pygame.surfarray.make_surface(frame)
-                    self.screen.blit(pygameFrame, (0, 0))
-                    pygame.display.update()
-                    print(frame)
-                    # print(codec)
-
-                    #write the flipped frame
-                    out.write(frame)
-
-                    # cv.imshow('frame',frame)
-                    if cv.waitKey(1) & 0xFF == ord('q'):
-                        break
-                else:
-                    break
-
-            cap.release()
-            out.release()
-            cv.destroyAllWindows()
-
+            # The display copies the frame, no need for a copy of our own
+            pooled = frame_read.borrow_frame()
+            if pooled is not None:
+                with pooled as frame:
+                    self.display.submit(frame)
 
+            self.update()
             time.sleep(1 / FPS)
 
         # Call it always before finishing. I deallocate resources.
+        if recorder is not None:
+            frame_read.remove_sink(recorder.write)
+            recorder.stop()
+            print(recorder.get_stats())
+        self.control.stop()
+        print(self.control.get_stats())
+        self.display.stop()
         self.tello.end()
 
 
@@ -205,14 +181,17 @@ class FrontEnd(object):
             self.send_rc_control = False
 
     def update(self):
-        """ Update routine. Send velocities to Tello."""
+        """ Update routine. Give the velocities to the control loop, which sends them to Tello."""
         if self.send_rc_control:
-            self.tello.send_rc_control(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
-                                       self.yaw_velocity)
+            self.control.set(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
+                             self.yaw_velocity)
+        else:
+            self.control.clear()
 
 
 def main():
 
+        start_logging()
         frontend = FrontEnd()
         frontend.run()
 
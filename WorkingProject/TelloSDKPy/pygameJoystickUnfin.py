@@ -5,12 +5,21 @@ import cv2 as cv
 import numpy as np
 import pygame
 from djitellopy import Tello
+from djitellopy.control import RCControlLoop
+from djitellopy.display import FrameDisplay
+from djitellopy.inference import InferenceScheduler
+from djitellopy.log import start_logging
+from djitellopy.model import DetectorModel
 from pygame.locals import *
 
 # Speed of the drone
 S = 60
 # Frames per second of the pygame window display
 FPS = 25
+# RC commands sent per second
+RC_RATE = 20
+# Frame rate of the Tello camera, the recording is written at this rate
+CAMERA_FPS = 30
 # video_output = None
 
 CONFIG_FILE = "yolov3.cfg"
@@ -77,6 +86,11 @@ class FrontEnd(object):
 
         pygame.display.set_caption("Tello video stream")
         self.screen = pygame.display.set_mode([960, 720])
+        self.display = FrameDisplay(self.screen, FPS)
+
+        # Load the detector before the flight, on the fastest backend and warmed up
+        self.model = DetectorModel.get_model(WEIGHTS_FILE, CONFIG_FILE)
+        print(self.model)
 
         # Init Tello object that interacts with the Tello drone
         self.tello = Tello()
@@ -90,8 +104,8 @@ class FrontEnd(object):
 
         self.send_rc_control = False
 
-        # create update timer
-        pygame.time.set_timer(USEREVENT + 1, 50)
+        # Sends the velocities to Tello at a fixed rate, whatever the event loop is doing
+        self.control = RCControlLoop(self.tello, RC_RATE)
 
         # Joystick Variables
         self.running = False
@@ -163,8 +177,10 @@ class FrontEnd(object):
         # frame_read = self.tello.get_frame_read()
         # print("got this tello frame and put it into pygame")
 
+        self.display.start()
         threading.Thread(target=self.runVideo).start()
 
+        self.control.start()
         self.should_stop = False
         while not self.should_stop:
 
@@ -182,9 +198,7 @@ class FrontEnd(object):
             #         self.keyup(event.key)
 
             for event in pygame.event.get():
-                if event.type == USEREVENT + 1:
-                    self.update()
-                elif event.type == QUIT:
+                if event.type == QUIT:
                     self.should_stop = True
                 elif event.type == JOYAXISMOTION:
                     if event.axis in self.AXISCONTROLMAP:
@@ -197,11 +211,13 @@ class FrontEnd(object):
                     else:
                         self.keydown(event.key)
 
-            self.screen.fill([0, 0, 0])
-
+            self.update()
             time.sleep(1 / FPS)
 
         # Call it always before finishing. I deallocate resources.
+        self.control.stop()
+        print(self.control.get_stats())
+        self.display.stop()
         self.tello.end()
 
 
@@ -214,34 +230,30 @@ class FrontEnd(object):
             classes = [line.strip() for line in f.readlines()]
 
         # define the codec and create VideoWriter object
-        scale = 0.00392
         fourcc = cv.VideoWriter_fourcc(*'MP4V')
-        out = cv.VideoWriter('myvideo.mp4', fourcc, 1, (640, 480))
-        net = cv.dnn.readNet(WEIGHTS_FILE, CONFIG_FILE)
-        frameCounter = 0;
+        out = cv.VideoWriter('myvideo.mp4', fourcc, CAMERA_FPS, (640, 480))
+        # Runs the detector as often as the measured latency and the free CPU allow, skipping still frames
+        scheduler = InferenceScheduler(max_rate=CAMERA_FPS, min_rate=1)
+        # cap.read and cv.resize write into these arrays instead of allocating new ones for every frame
+        frame = None
+        recordFrame = None
+        # Detections of the last inference, drawn on every frame until the next one
+        detections = []
 
         while cap.isOpened() and not self.should_stop:
-            ret, frame = cap.read()
+            ret, frame = cap.read(frame)
             if ret:
-                frameCounter += 1
-
-                # Run analysis every second.
-                if frameCounter%30 == 0:
-                    blob = cv.dnn.blobFromImage(frame, scale, (416, 416), (0, 0, 0), True, crop=False)
-                    net.setInput(blob)
-
-                    frame = self.run_inference(net, frame, classes)
+                if scheduler.should_run(frame):
+                    start = time.monotonic()
+                    detections = self.run_inference(self.model, frame)
+                    scheduler.add_latency(time.monotonic() - start)
 
-                    displayFrame = cv.flip(frame, 90)
-                    displayFrame = np.rot90(displayFrame)
-                    displayFrame = cv.cvtColor(displayFrame, cv.COLOR_BGR2RGB)
+                # Every camera frame is recorded, so the file plays at the right speed whatever the inference rate
+                frame = self.draw_detections(frame, classes, detections)
+                recordFrame = cv.resize(frame, (640, 480), recordFrame)
+                out.write(recordFrame)
 
-                    pygameFrame = pygame.surfarray.make_surface(displayFrame)
-                    self.screen.blit(pygameFrame, (0, 0))
-                    pygame.display.update()
-
-                    frame = cv.resize(frame, (640, 480))
-                    out.write(frame)
+                self.display.submit(frame)
 
                 if cv.waitKey(1) & 0xFF == ord('q'):
                     break
@@ -252,65 +264,23 @@ class FrontEnd(object):
         out.release()
         cv.destroyAllWindows()
 
-    def get_output_layers(self, net):
-        layer_names = net.getLayerNames()
-        output_layers = [layer_names[i[0] - 1] for i in net.getUnconnectedOutLayers()]
-        return output_layers
-
     def draw_bounding_box(self, frame, classes, class_id, confidence, x, y, x_plus_w, y_plus_h):
         label = str(classes[class_id] + str(confidence))
         frame = cv.rectangle(frame, (x, y), (x_plus_w, y_plus_h), [255, 0, 0], 2)
         frame = cv.putText(frame, label, (x - 10, y - 10), cv.FONT_HERSHEY_SIMPLEX, 0.5, [255, 0, 0], 2)
         return frame
 
-    def run_inference(self, net, frame, classes):
-        Width = frame.shape[1]
-        Height = frame.shape[0]
-
-        # run inference through the network
-        # and gather predictions from output layers
-        outs = net.forward(self.get_output_layers(net))
-
-        # initialization
-        class_ids = []
-        confidences = []
-        boxes = []
+    def run_inference(self, model, frame):
+        # run the detector, ignoring weak detections (confidence < 0.5),
+        # and apply non-max suppression
         conf_threshold = 0.5
         nms_threshold = 0.4
+        return model.detect(frame, conf_threshold, nms_threshold)
 
-        # for each detetion from each output layer
-        # get the confidence, class id, bounding box params
-        # and ignore weak detections (confidence < 0.5)
-        for out in outs:
-            for detection in out:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                if confidence > 0.5:
-                    center_x = int(detection[0] * Width)
-                    center_y = int(detection[1] * Height)
-                    w = int(detection[2] * Width)
-                    h = int(detection[3] * Height)
-                    x = center_x - w / 2
-                    y = center_y - h / 2
-                    class_ids.append(class_id)
-                    confidences.append(float(confidence))
-                    boxes.append([x, y, w, h])
-
-        # apply non-max suppression
-        indices = cv.dnn.NMSBoxes(boxes, confidences, conf_threshold, nms_threshold)
-
-        # go through the detections remaining
-        # after nms and draw bounding box
-        for i in indices:
-            i = i[0]
-            box = boxes[i]
-            x = box[0]
-            y = box[1]
-            w = box[2]
-            h = box[3]
-
-            frame = self.draw_bounding_box(frame, classes, class_ids[i], confidences[i], round(x), round(y), round(x + w), round(y + h))
+    def draw_detections(self, frame, classes, detections):
+        # draw the bounding box of the detections remaining after nms
+        for class_id, confidence, x, y, w, h in detections:
+            frame = self.draw_bounding_box(frame, classes, class_id, confidence, round(x), round(y), round(x + w), round(y + h))
 
         return frame
 
@@ -359,14 +329,17 @@ class FrontEnd(object):
             self.send_rc_control = False
 
     def update(self):
-        """ Update routine. Send velocities to Tello."""
+        """ Update routine. Give the velocities to the control loop, which sends them to Tello."""
         if self.send_rc_control:
-            self.tello.send_rc_control(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
-                                       self.yaw_velocity)
+            self.control.set(self.left_right_velocity, self.for_back_velocity, self.up_down_velocity,
+                             self.yaw_velocity)
+        else:
+            self.control.clear()
 
 
 def main():
 
+        start_logging()
         frontend = FrontEnd()
         frontend.run()
 
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from djitellopy.detection import decode_yolo, detect_objects
+
+WIDTH = 960
+HEIGHT = 720
+
+
+def row(center_x, center_y, w, h, scores, objectness=1.0):
+    """One output row of a YOLO layer, coordinates relative to the image size"""
+    return [center_x, center_y, w, h, objectness] + list(scores)
+
+
+def layer(*rows, classes=3):
+    return np.array(rows, np.float32).reshape(-1, 5 + classes)
+
+
+def test_threshold_and_argmax():
+    outs = [layer(row(0.5, 0.5, 0.2, 0.1, [0.1, 0.9, 0.3]),
+                  row(0.5, 0.5, 0.2, 0.1, [0.5, 0.2, 0.1]),  # equal to the threshold, dropped
+                  row(0.5, 0.5, 0.2, 0.1, [0.2, 0.3, 0.7]))]
+    boxes, confidences, class_ids = decode_yolo(outs, WIDTH, HEIGHT, conf_threshold=0.5)
+
+    assert class_ids.tolist() == [1, 2]
+    assert confidences.tolist() == pytest.approx([0.9, 0.7])
+    assert boxes.dtype == np.float32 and confidences.dtype == np.float32 and class_ids.dtype == np.int32
+
+
+def test_boxes_in_pixels():
+    outs = [layer(row(0.5, 0.25, 0.1, 0.2, [0.0, 0.8, 0.0]),
+                  row(0.1003, 0.9003, 0.0503, 0.0503, [0.8, 0.0, 0.0]))]
+    boxes, confidences, class_ids = decode_yolo(outs, WIDTH, HEIGHT)
+
+    # Center and size truncated to whole pixels, then the top left corner
+    assert boxes[0].tolist() == [480 - 48, 180 - 72, 96, 144]
+    assert boxes[1].tolist() == [96 - 24, 648 - 18, 48, 36]
+
+
+def test_several_output_layers():
+    outs = [layer(row(0.5, 0.5, 0.1, 0.1, [0.9, 0.0, 0.0])),
+            layer(row(0.2, 0.2, 0.1, 0.1, [0.0, 0.1, 0.0]),
+                  row(0.8, 0.8, 0.1, 0.1, [0.0, 0.0, 0.6])),
+            layer()]
+    boxes, confidences, class_ids = decode_yolo(outs, WIDTH, HEIGHT)
+
+    # Rows of all the layers, in order
+    assert class_ids.tolist() == [0, 2]
+    assert boxes[:, 0].tolist() == [480 - 48, 768 - 48]
+
+
+def test_score_ties_take_the_first_class():
+    outs = [layer(row(0.5, 0.5, 0.1, 0.1, [0.3, 0.8, 0.8]),
+                  row(0.5, 0.5, 0.1, 0.1, [0.7, 0.7, 0.7]))]
+    boxes, confidences, class_ids = decode_yolo(outs, WIDTH, HEIGHT)
+
+    assert class_ids.tolist() == [1, 0]
+    assert confidences.tolist() == pytest.approx([0.8, 0.7])
+
+
+def test_empty():
+    for outs in ([layer()], [layer(), layer()], [layer(row(0.5, 0.5, 0.1, 0.1, [0.1, 0.2, 0.3]))]):
+        boxes, confidences, class_ids = decode_yolo(outs, WIDTH, HEIGHT)
+        assert boxes.shape == (0, 4) and confidences.shape == (0,) and class_ids.shape == (0,)
+        assert detect_objects(outs, WIDTH, HEIGHT) == []
+
+
+def test_detect_objects_suppresses_overlaps():
+    outs = [layer(row(0.5, 0.5, 0.2, 0.2, [0.0, 0.9, 0.0]),
+                  row(0.51, 0.5, 0.2, 0.2, [0.0, 0.8, 0.0]),  # same object, lower score
+                  row(0.1, 0.1, 0.1, 0.1, [0.0, 0.0, 0.7]))]
+    detections = detect_objects(outs, WIDTH, HEIGHT, conf_threshold=0.5, nms_threshold=0.4)
+
+    assert sorted((class_id, round(confidence, 2)) for class_id, confidence, x, y, w, h in detections) == \
+        [(1, 0.9), (2, 0.7)]
+    assert (1, 480 - 96, 360 - 72, 192, 144) in [(c, x, y, w, h) for c, conf, x, y, w, h in detections]
@@ -73,15 +73,7 @@ def train(self):
 
     if ckpt: _save_ckpt(self, *args)
 
-def return_predict(self, im):
-    assert isinstance(im, np.ndarray), \
-				'Image is not a np.ndarray'
-    h, w, _ = im.shape
-    im = self.framework.resize_input(im)
-    this_inp = np.expand_dims(im, 0)
-    feed_dict = {self.inp : this_inp}
-
-    out = self.sess.run(self.out, feed_dict)[0]
+def _boxes_info(self, out, h, w):
     boxes = self.framework.findboxes(out)
     threshold = self.FLAGS.threshold
     boxesInfo = list()
@@ -101,6 +93,32 @@ def return_predict(self, im):
         })
     return boxesInfo
 
+def return_predict(self, im):
+    assert isinstance(im, np.ndarray), \
+				'Image is not a np.ndarray'
+    h, w, _ = im.shape
+    im = self.framework.resize_input(im)
+    this_inp = np.expand_dims(im, 0)
+    feed_dict = {self.inp : this_inp}
+
+    out = self.sess.run(self.out, feed_dict)[0]
+    return _boxes_info(self, out, h, w)
+
+def return_predict_batch(self, ims):
+    """Predict several images with a single forward pass, returns
+    one list of boxes per image, as return_predict does"""
+    for im in ims:
+        assert isinstance(im, np.ndarray), \
+				'Image is not a np.ndarray'
+    if not len(ims): return list()
+
+    this_inp = np.stack([self.framework.resize_input(im) for im in ims], 0)
+    feed_dict = {self.inp : this_inp}
+
+    out = self.sess.run(self.out, feed_dict)
+    return [_boxes_info(self, out[i], im.shape[0], im.shape[1])
+            for i, im in enumerate(ims)]
+
 import math
 
 def predict(self):
@@ -188,6 +188,20 @@ def test_RETURNPREDICT_PBLOAD_YOLOv2():
 
     assert compareObjectData(testImg["expected-objects"]["yolo"], loadedPredictions, testImg["width"], testImg["height"], threshCompareThreshold, posCompareThreshold), "Generated object predictions from return_predict() were not within margin of error compared to expected values."
 
+def test_RETURNPREDICTBATCH_PBLOAD_YOLOv2():
+    #Test predicting several images with a single forward pass
+    #NOTE: This test verifies that every image of the batch gets the same predictions as when it is predicted alone with return_predict().
+
+    options = {"pbLoad": pbPath, "metaLoad": metaPath, "threshold": 0.4}
+    tfnet = TFNet(options)
+    imgcv = cv2.imread(testImg["path"])
+    batchPredictions = tfnet.return_predict_batch([imgcv, cv2.flip(imgcv, 1), imgcv])
+
+    assert len(batchPredictions) == 3, "Expected one list of predictions per image, got {0}.".format(len(batchPredictions))
+    assert compareObjectData(testImg["expected-objects"]["yolo"], batchPredictions[0], testImg["width"], testImg["height"], threshCompareThreshold, posCompareThreshold), "Generated object predictions from return_predict_batch() were not within margin of error compared to expected values."
+    assert compareObjectData(testImg["expected-objects"]["yolo"], batchPredictions[2], testImg["width"], testImg["height"], threshCompareThreshold, posCompareThreshold), "Generated object predictions from return_predict_batch() were not within margin of error compared to expected values."
+    assert tfnet.return_predict_batch([]) == [], "Expected no predictions for an empty batch."
+
 #TESTS FOR TRAINING
 def test_TRAIN_FROM_WEIGHTS_CLI__LOAD_CHECKPOINT_RETURNPREDICT_YOLOv2():
     #Test training using pre-generated weights for tiny-yolo-voc